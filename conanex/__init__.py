@@ -1,92 +1,76 @@
+import argparse
+import hashlib
 import os
-from pathlib import Path
 
 from conan import ConanFile
-from conanex.main import install_package_from_git, install_package_from_zip, install_package_from_path, \
-    install_package_from_conanfile, install_package_from_remote, ExternalPackage
+from conanex.cache import conanex_home
+from conanex.main import install_external_packages, parse_external_package, ConanArgs, ExternalPackage
 
 
-class ConanExFile(ConanFile):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-    def get_args(self):
-        args = object()
-
-        # Reference
-        args.name = self.name
-        args.version = self.version
-        args.user = self.user
-        args.channel = self.channel
-
-        # Metadata
-        args.url = self.url
-        args.license = self.license
-        args.author = self.author
-        args.description = self.description
-        args.topics = self.topics
-        args.homepage = self.homepage
-
-        args.build_policy = self.build_policy
-        args.upload_policy = self.upload_policy
-
-        args.exports = self.exports
-        args.exports_sources = self.exports_sources
-
-        args.generators = self.generators
-        args.revision_mode = self.revision_mode
+def with_external_requires(requirements):
+    def wrapper(self):
+        self.install_external_requires()
+        requirements(self)
+    return wrapper
 
-        # Binary model: Settings and Options
-        args.settings = self.settings
-        args.options = self.options
-        args.default_options = self.default_options
-        args.default_build_options = self.default_build_options
-        args.package_type = self.package_type
 
-        args.implements = self.implements
-
-        args.provides = self.provides
-        args.deprecated = self.deprecated
-
-        args.win_bash = self.win_bash
-        args.win_bash_run = self.win_bash_run
-
-        # #### Requirements
-        args.requires = self.requires
-        args.tool_requires = self.tool_requires
-        args.build_requires = self.build_requires
-        args.test_requires = self.test_requires
-        args.tested_reference_str = self.tested_reference_str
-
-        args.no_copy_source = self.no_copy_source
-        args.recipe_folder = self.recipe_folder
-
-        # Package information
-        args.cpp = self.cpp
-        args.buildenv_info = self.buildenv_info
-        args.runenv_info = self.runenv_info
-        args.conf_info = self.conf_info
+class ConanExFile(ConanFile):
+    # External packages in conanfile.txt syntax, for example:
+    # 'flatbuffers/22.10.26 { git = https://github.com/google/flatbuffers, tag = v22.10.26 }'
+    external_requires = []
+    # Number of external packages that are built concurrently, sources are always fetched concurrently
+    external_jobs = 1
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'requirements' in cls.__dict__:
+            cls.requirements = with_external_requires(cls.__dict__['requirements'])
+
+    def requirements(self):
+        self.install_external_requires()
+
+    def get_external_requires(self):
+        external_requires = self.external_requires
+        if isinstance(external_requires, str):
+            external_requires = [external_requires]
+        packages = []
+        for external_require in external_requires:
+            if isinstance(external_require, ExternalPackage):
+                packages.append(external_require)
+            else:
+                packages.append(parse_external_package(external_require.strip()))
+        return packages
 
-        return args
+    def get_args(self):
+        args = argparse.Namespace()
+        args.path_or_reference = os.path.join(self.recipe_folder, "conanfile.py")
+        # Recipe folder is export folder in conan cache when recipe is used as dependency,
+        # so install journal is kept outside of it
+        args.journal_folder = os.path.join(conanex_home(), "journals",
+                                           hashlib.sha1(os.path.abspath(self.recipe_folder).encode()).hexdigest())
+        args.build = 'missing'
+        args.settings = ["{}={}".format(name, value)
+                         for name, value in self.settings.items() if value is not None]
+        settings_build = getattr(self, 'settings_build', None)
+        if settings_build:
+            setattr(args, 'settings:build', ["{}={}".format(name, value)
+                                             for name, value in settings_build.items() if value is not None])
+        return ConanArgs(args)
+
+    def install_external_requires(self):
+        if getattr(self, '_external_requires_installed', False):
+            return
+        self._external_requires_installed = True
+
+        packages = self.get_external_requires()
+        install_external_packages(self.get_args(), packages, self.external_jobs)
+        for package in packages:
+            self.requires(package.full_package_name.rstrip('@'))
 
     def __call__(self, *args, **kwargs):
         if 'package' in kwargs:
             package: ExternalPackage = kwargs['package']
-            args = self.get_args()
-            if package.protocol == 'git':
-                install_package_from_git(args, package)
-            elif package.protocol == 'zip':
-                install_package_from_zip(args, package)
-            elif package.protocol == 'path':
-                conanfile = package.url
-                conanfile_path = os.path.dirname(conanfile)
-                conanfile_posix_path = Path(conanfile_path).as_posix()
-                path = str(Path("{}/{}".format(conanfile_posix_path, package.url)))
-                install_package_from_path(args, package, path)
-            elif package.protocol == 'conan':
-                install_package_from_conanfile(args, package)
-            elif package.protocol == 'remote':
-                install_package_from_remote(args, package)
+            install_external_packages(self.get_args(), [package], self.external_jobs)
         else:
             self.requires(*args, **kwargs)
 
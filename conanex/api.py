@@ -0,0 +1,204 @@
+"""
+Python API of conanex for build orchestrators, it does not depend on sys.argv and returns structured results.
+
+    from conanex.api import InstallOptions, install
+
+    result = install("path/to/conanfile.txt", InstallOptions(profile="linux-x86_64", build="missing"))
+    for package in result.packages:
+        print(package.reference, package.cache_hit, package.create_time)
+
+Messages of conanex and output of conan commands are not printed, they go to "conanex" logger
+or to the output callable passed to install, plan and fetch.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from typing import List
+
+from conanex.main import ConanArgs, ExternalPackage, generate_new_conanfile, resolve_conanfile_path, \
+    install_conanfile, install_workspace, fetch_sources, plan_install
+from conanex.output import redirect_output
+
+logger = logging.getLogger("conanex")
+
+
+class InstallOptions:
+    """ Options of install, names follow options of conanex install command line """
+
+    def __init__(self, profile=None, profile_build=None, settings=None, settings_build=None,
+                 options=None, options_build=None, conf=None, conf_build=None, build=None,
+                 remote=None, update=False, generator=None, output_folder=None, deployer=None,
+                 lockfile=None, external_jobs=1, matrix_profiles=None, matrix_settings=None,
+                 from_bundle=None, offline=False, fetch_jobs=None, fetch_jobs_per_host=None, keep_going=False,
+                 compiler_cache=None):
+        self.profile = profile
+        self.profile_build = profile_build
+        self.settings = list(settings or [])
+        self.settings_build = list(settings_build or [])
+        self.options = list(options or [])
+        self.options_build = list(options_build or [])
+        self.conf = list(conf or [])
+        self.conf_build = list(conf_build or [])
+        self.build = build
+        self.remote = remote
+        self.update = update
+        self.generator = generator
+        self.output_folder = output_folder
+        self.deployer = deployer
+        self.lockfile = lockfile
+        self.external_jobs = external_jobs
+        self.matrix_profiles = list(matrix_profiles or [])
+        self.matrix_settings = list(matrix_settings or [])
+        self.from_bundle = from_bundle
+        self.offline = offline
+        self.fetch_jobs = fetch_jobs
+        self.fetch_jobs_per_host = fetch_jobs_per_host
+        self.keep_going = keep_going
+        # 'ccache'
+        self.compiler_cache = compiler_cache
+
+    def to_args(self, path_or_reference=None, workspace=None):
+        args = argparse.Namespace(path_or_reference=path_or_reference, workspace=workspace,
+                                  profile=self.profile, settings=self.settings, options=self.options,
+                                  conf=self.conf, build=self.build, remote=self.remote, update=self.update,
+                                  generator=self.generator, output_folder=self.output_folder,
+                                  deployer=self.deployer, lockfile=self.lockfile,
+                                  external_jobs=self.external_jobs, matrix_profile=self.matrix_profiles,
+                                  matrix_settings=self.matrix_settings, from_bundle=self.from_bundle,
+                                  offline=self.offline, fetch_jobs=self.fetch_jobs,
+                                  fetch_jobs_per_host=self.fetch_jobs_per_host, keep_going=self.keep_going,
+                                  compiler_cache=self.compiler_cache)
+        setattr(args, 'profile:build', self.profile_build)
+        setattr(args, 'settings:build', self.settings_build)
+        setattr(args, 'options:build', self.options_build)
+        setattr(args, 'conf:build', self.conf_build)
+        return ConanArgs(args)
+
+
+class FetchOptions:
+    def __init__(self, only_recipe=False, package_query=None, fetch_jobs=None, fetch_jobs_per_host=None):
+        self.only_recipe = only_recipe
+        self.package_query = package_query
+        self.fetch_jobs = fetch_jobs
+        self.fetch_jobs_per_host = fetch_jobs_per_host
+
+    def to_args(self, path_or_reference=None, workspace=None):
+        return ConanArgs(argparse.Namespace(path_or_reference=path_or_reference, workspace=workspace,
+                                            only_recipe=self.only_recipe, package_query=self.package_query,
+                                            fetch_jobs=self.fetch_jobs, fetch_jobs_per_host=self.fetch_jobs_per_host))
+
+
+class PackageResult:
+    """ Result of external package for one profile, statistics are the same that are shown by conanex stats """
+
+    def __init__(self, package: ExternalPackage, profile=None):
+        self.package = package
+        self.reference = package.full_package_name.rstrip('@')
+        self.protocol = package.protocol
+        self.profile = profile
+        self.stats = dict(package.stats)
+
+    @property
+    def cache_hit(self):
+        return bool(self.stats.get('cache_hit', False))
+
+    @property
+    def source_cache_hit(self):
+        return bool(self.stats.get('source_cache_hit', False))
+
+    @property
+    def built(self):
+        return 'create_time' in self.stats
+
+    @property
+    def create_time(self):
+        return self.stats.get('create_time')
+
+    @property
+    def fetch_time(self):
+        return self.stats.get('fetch_time', 0.0)
+
+    @property
+    def bytes_downloaded(self):
+        return self.stats.get('bytes_downloaded', 0)
+
+    @property
+    def compiler_cache_hits(self):
+        return self.stats.get('compiler_cache_hits', 0)
+
+    @property
+    def compiler_cache_misses(self):
+        return self.stats.get('compiler_cache_misses', 0)
+
+    def __repr__(self):
+        return "PackageResult({!r}, profile={!r}, stats={!r})".format(self.reference, self.profile, self.stats)
+
+
+class InstallResult:
+    def __init__(self, packages: List[PackageResult], installs, duration):
+        self.packages = packages
+        # (conanfile, output folder) of every conan install that was run
+        self.installs = installs
+        self.duration = duration
+
+    @property
+    def output_folders(self):
+        return [output_folder for _, output_folder in self.installs]
+
+    def __repr__(self):
+        return "InstallResult(packages={!r}, installs={!r}, duration={:.1f})".format(self.packages, self.installs,
+                                                                                    self.duration)
+
+
+class FetchResult:
+    def __init__(self, packages: List[PackageResult], duration):
+        self.packages = packages
+        self.duration = duration
+
+    def __repr__(self):
+        return "FetchResult(packages={!r}, duration={:.1f})".format(self.packages, self.duration)
+
+
+def parse_conanfile(conanfile_path) -> List[ExternalPackage]:
+    """ Returns external packages of conanfile.txt (or of conanfile.txt in folder) """
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        return generate_new_conanfile(ConanArgs(argparse.Namespace()), resolve_conanfile_path(conanfile_path),
+                                      os.path.join(tmpdirname, "conanfile.txt"))
+
+
+def make_install_result(package_results, installs, started):
+    return InstallResult([PackageResult(package, profile) for profile, package in package_results],
+                         [(conanfile_path, os.path.abspath(entry_args.output_folder))
+                          for conanfile_path, entry_args in installs],
+                         time.monotonic() - started)
+
+
+def install(conanfile_path=None, options: InstallOptions = None, workspace=None, output=None) -> InstallResult:
+    """
+    Installs conanfile.txt or all conanfile.txt of workspace folder or glob,
+    output is called with every message instead of logger, lambda message: None makes install quiet
+    """
+    started = time.monotonic()
+    args = (options or InstallOptions()).to_args(path_or_reference=conanfile_path, workspace=workspace)
+    with redirect_output(output or logger.info):
+        if workspace:
+            return make_install_result(*install_workspace(args), started)
+        return make_install_result(*install_conanfile(args), started)
+
+
+def plan(conanfile_path=None, options: InstallOptions = None, workspace=None, output=None) -> dict:
+    """ Plan of install without fetching and building anything, the same as install --plan --plan-format json """
+    args = (options or InstallOptions()).to_args(path_or_reference=conanfile_path, workspace=workspace)
+    with redirect_output(output or logger.info):
+        return plan_install(args)
+
+
+def fetch(conanfile_path=None, options: FetchOptions = None, workspace=None, output=None) -> FetchResult:
+    started = time.monotonic()
+    args = (options or FetchOptions()).to_args(path_or_reference=conanfile_path, workspace=workspace)
+    with redirect_output(output or logger.info):
+        packages = fetch_sources(args)
+    return FetchResult([PackageResult(package) for package in packages], time.monotonic() - started)
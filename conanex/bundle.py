@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+
+BUNDLE_VERSION = 1
+BUNDLE_INDEX = "index.json"
+
+
+def package_spec(package):
+    """ Identity of external package, bundle entry is used only for exactly the same package definition """
+    attrs = {name: value.strip("'").strip('"') for name, value in package.attrs.items()}
+    return json.dumps([package.name, package.version, package.user, package.channel,
+                       package.protocol, package.url, sorted(attrs.items())])
+
+
+def walk_tree(dirname):
+    for root, dirs, files in os.walk(dirname):
+        dirs.sort()
+        for name in sorted(files + [d for d in dirs if os.path.islink(os.path.join(root, d))]):
+            path = os.path.join(root, name)
+            yield path, os.path.relpath(path, dirname).replace(os.sep, '/')
+
+
+def tree_digest(dirname):
+    digest = hashlib.sha256()
+    for path, relpath in walk_tree(dirname):
+        digest.update(relpath.encode())
+        if os.path.islink(path):
+            digest.update(b"l" + os.readlink(path).encode())
+        else:
+            file_hash = hashlib.sha256()
+            with open(path, "rb") as f:
+                for byte_block in iter(lambda: f.read(65536), b""):
+                    file_hash.update(byte_block)
+            digest.update(b"f" + file_hash.digest())
+    return digest.hexdigest()
+
+
+class BundleWriter:
+    """
+    Writes zip archive with sources of external packages and conan cache archives of remote packages.
+    Zip central directory allows to read only entries that are needed on import.
+    """
+
+    def __init__(self, path):
+        self.zipfile = ZipFile(path, 'w')
+        self.index = {'version': BUNDLE_VERSION, 'sources': {}, 'packages': []}
+
+    def add_sources(self, package, kind, key, source_dir):
+        entry = "{}/{}".format(kind, key)
+        if entry not in self.index['sources']:
+            prefix = "sources/{}/".format(entry)
+            for path, relpath in walk_tree(source_dir):
+                if os.path.islink(path):
+                    info = ZipInfo(prefix + relpath)
+                    info.external_attr = (stat.S_IFLNK | 0o777) << 16
+                    self.zipfile.writestr(info, os.readlink(path))
+                else:
+                    self.zipfile.write(path, prefix + relpath, compress_type=ZIP_DEFLATED)
+            # Empty folders are kept as well, git does not recognize repository without .git/refs
+            for root, dirs, files in os.walk(source_dir):
+                if not dirs and not files:
+                    relpath = os.path.relpath(root, source_dir).replace(os.sep, '/')
+                    self.zipfile.writestr(ZipInfo(prefix + relpath + '/'), b'')
+            self.index['sources'][entry] = {'kind': kind, 'key': key, 'digest': tree_digest(source_dir)}
+        self.index['packages'].append({'spec': package_spec(package),
+                                       'package': package.full_package_name,
+                                       'sources': entry})
+
+    def add_conan_cache(self, package, cache_archive_path):
+        name = "conan_cache/{}.tgz".format(hashlib.sha1(package.full_package_name.encode()).hexdigest())
+        # Conan cache archive is already compressed
+        self.zipfile.write(cache_archive_path, name, compress_type=ZIP_STORED)
+        self.index['packages'].append({'spec': package_spec(package),
+                                       'package': package.full_package_name,
+                                       'conan_cache': name})
+
+    def close(self):
+        self.zipfile.writestr(BUNDLE_INDEX, json.dumps(self.index, indent=2))
+        self.zipfile.close()
+
+
+class Bundle:
+    def __init__(self, path):
+        self.path = path
+        self.zipfile = ZipFile(path, 'r')
+        self.index = json.loads(self.zipfile.read(BUNDLE_INDEX))
+        if self.index.get('version') != BUNDLE_VERSION:
+            raise Exception("Unsupported version {} of bundle {}".format(self.index.get('version'), path))
+        self.packages = {entry['spec']: entry for entry in self.index['packages']}
+
+    def find(self, package):
+        entry = self.packages.get(package_spec(package))
+        if entry is None:
+            raise Exception("{} with the same definition was not found in bundle {}"
+                            .format(package.full_package_name, self.path))
+        return entry
+
+    def extract_sources(self, entry, dirname):
+        prefix = "sources/{}/".format(entry)
+        for info in self.zipfile.infolist():
+            if not info.filename.startswith(prefix):
+                continue
+            parts = info.filename[len(prefix):].split('/')
+            if '..' in parts:
+                raise Exception("Bundle {} contains invalid path {}".format(self.path, info.filename))
+            path = os.path.join(dirname, *parts)
+            if info.is_dir():
+                os.makedirs(path, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            mode = info.external_attr >> 16
+            if stat.S_ISLNK(mode):
+                os.symlink(self.zipfile.read(info).decode(), path)
+                continue
+            with self.zipfile.open(info) as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            if mode & 0o777:
+                os.chmod(path, mode & 0o777)
+
+        digest = tree_digest(dirname)
+        if digest != self.index['sources'][entry]['digest']:
+            raise Exception("Calculated digest '{}' of {} sources in bundle {} is not equal to {}"
+                            .format(digest, entry, self.path, self.index['sources'][entry]['digest']))
+
+    def fetch(self, package, source_cache):
+        entry = self.find(package)
+        if 'sources' not in entry:
+            raise Exception("{} has no sources in bundle {}".format(package.full_package_name, self.path))
+        sources = self.index['sources'][entry['sources']]
+        source_dir = source_cache.lookup(sources['kind'], sources['key'])
+        if source_dir:
+            return source_dir
+        return source_cache.store(sources['kind'], sources['key'],
+                                  lambda dirname: self.extract_sources(entry['sources'], dirname))
+
+    def conan_cache_archives(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            for entry in self.index['packages']:
+                if 'conan_cache' not in entry:
+                    continue
+                yield entry['package'], self.zipfile.extract(entry['conan_cache'], tmpdirname)
+
+    def close(self):
+        self.zipfile.close()
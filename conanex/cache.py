@@ -0,0 +1,143 @@
+import errno
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+
+from conanex.output import write_output
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl request for FICLONE (_IOW(0x94, 9, int)), supported by btrfs, xfs and other CoW filesystems
+FICLONE = 0x40049409
+
+
+def conanex_home():
+    return os.environ.get("CONANEX_HOME", os.path.join(str(Path.home()), ".conanex"))
+
+
+def reflink_file(src, dst):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported on this platform")
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copystat(src, dst)
+
+
+class TreeMaterializer:
+    """
+    Copy function for shutil.copytree that uses the cheapest available way to
+    create a file: reflink, then a plain copy. Once a method fails it is not retried
+    for the remaining files of the tree. Hardlinks are not used, in-place write to
+    working copy (patch of recipe, generated files) would modify the cached tree.
+    """
+
+    def __init__(self):
+        self.methods = [reflink_file, shutil.copy2]
+
+    @property
+    def method(self):
+        return self.methods[0].__name__
+
+    def __call__(self, src, dst):
+        while True:
+            try:
+                return self.methods[0](src, dst)
+            except OSError:
+                if len(self.methods) == 1:
+                    raise
+                if os.path.lexists(dst):
+                    os.remove(dst)
+                self.methods.pop(0)
+
+
+def materialize_tree(src, dst):
+    materializer = TreeMaterializer()
+    shutil.copytree(src, dst, symlinks=True, copy_function=materializer, dirs_exist_ok=True)
+    return materializer.method
+
+
+class SourceCache:
+    """
+    Persistent cache of unpacked source trees.
+    Entries are stored as <root>/<kind>/<key>, where key is an archive digest or a commit SHA,
+    and are never modified once they are published.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(conanex_home(), "sources")
+
+    def entry_path(self, kind, key):
+        return os.path.join(self.root, kind, key)
+
+    def entry_of(self, path):
+        kind, key = Path(os.path.relpath(path, self.root)).parts[:2]
+        return kind, key
+
+    def open_work_dir(self):
+        """ Temporary working copy is created on filesystem of cache, so it could be reflinked """
+        work_root = os.path.join(self.root, ".work")
+        os.makedirs(work_root, exist_ok=True)
+        return tempfile.TemporaryDirectory(dir=work_root)
+
+    def lookup(self, kind, key):
+        path = self.entry_path(kind, key)
+        if os.path.isdir(path):
+            return path
+        return None
+
+    def partial_path(self, kind, key):
+        return os.path.join(self.root, kind, ".partial-" + key)
+
+    def claim_partial(self, kind, key, staging_dir):
+        # Rename is atomic, so partial entry is continued by only one process
+        os.rmdir(staging_dir)
+        try:
+            os.rename(self.partial_path(kind, key), staging_dir)
+            write_output("Resuming {} {} from previous attempt".format(kind, key))
+        except OSError:
+            os.makedirs(staging_dir, exist_ok=True)
+
+    def keep_partial(self, kind, key, staging_dir):
+        try:
+            os.rename(staging_dir, self.partial_path(kind, key))
+        except OSError:
+            # Other process has already kept its partial entry
+            pass
+
+    def store(self, kind, key, populate, resumable=False):
+        """
+        With resumable, content of staging dir that populate has failed on is kept,
+        and populate of the next store of the same entry starts from it
+        """
+        path = self.entry_path(kind, key)
+        if os.path.isdir(path):
+            return path
+        kind_root = os.path.join(self.root, kind)
+        os.makedirs(kind_root, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=".tmp-", dir=kind_root)
+        if resumable:
+            self.claim_partial(kind, key, staging_dir)
+        try:
+            try:
+                populate(staging_dir)
+                os.rename(staging_dir, path)
+            except OSError:
+                # Other process has published the same entry first
+                if not os.path.isdir(path):
+                    raise
+        except BaseException:
+            if resumable:
+                self.keep_partial(kind, key, staging_dir)
+            raise
+        finally:
+            if os.path.isdir(staging_dir):
+                shutil.rmtree(staging_dir, ignore_errors=True)
+        return path
+
+
+source_cache = SourceCache()
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+
+from contextlib import contextmanager
+from pathlib import Path
+
+CMAKE_EXTRA_VARIABLES_CONF = 'tools.cmake.cmaketoolchain:extra_variables'
+
+
+def conan_home():
+    return os.environ.get("CONAN_HOME", os.path.join(str(Path.home()), ".conan2"))
+
+
+def count_ccache_stats_log(stats_log):
+    """ Returns (hits, misses) of compilations written to ccache stats log """
+    hits = misses = 0
+    try:
+        with open(stats_log) as f:
+            counters = [line.strip() for line in f if not line.startswith('#')]
+    except OSError:
+        return 0, 0
+    for counter in counters:
+        if counter.endswith('cache_hit'):
+            hits += 1
+        elif counter == 'cache_miss':
+            misses += 1
+    return hits, misses
+
+
+class Ccache:
+    """
+    ccache with paths inside conan cache rewritten to relative ones, so the same sources hit the cache
+    from any build folder of conan cache. Every build writes its own stats log.
+    """
+    name = 'ccache'
+
+    def __init__(self, executable):
+        self.executable = executable
+
+    @contextmanager
+    def session(self, stats):
+        """ Yields environment of build, hits and misses of build are added to stats """
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            stats_log = os.path.join(tmpdirname, "stats.log")
+            try:
+                yield {'CCACHE_BASEDIR': os.path.join(conan_home(), "p"),
+                       'CCACHE_NOHASHDIR': 'true',
+                       'CCACHE_STATSLOG': stats_log}
+            finally:
+                stats['compiler_cache_hits'], stats['compiler_cache_misses'] = count_ccache_stats_log(stats_log)
+
+
+# sccache is not supported: it has no equivalent of CCACHE_BASEDIR, and conan create builds every time
+# in a new folder of conan cache, so its hits would be rare
+COMPILER_CACHES = {'ccache': Ccache}
+
+
+def find_compiler_cache(name):
+    if name not in COMPILER_CACHES:
+        raise Exception("Unknown compiler cache {}, supported are: {}".format(name, ', '.join(COMPILER_CACHES)))
+    executable = shutil.which(name)
+    if executable is None:
+        raise Exception("{} was not found in PATH".format(name))
+    return COMPILER_CACHES[name](executable)
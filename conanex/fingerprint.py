@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import time
+
+from fnmatch import fnmatch
+
+from conanex.cache import conanex_home
+
+# Files generated inside of recipe folder by conan itself and local builds, they should not trigger rebuild.
+# Build folders are ignored only where cmake_layout puts them, in recipe folder and in test_package,
+# folders named build deeper in sources are sources as well
+IGNORED_DIRS = {'.git', '.hg', '.svn', '__pycache__'}
+IGNORED_PATHS = {'build', 'build-*', 'test_package/build', 'test_package/build-*'}
+IGNORED_FILES = {'CMakeUserPresets.json', 'test_package/CMakeUserPresets.json'}
+
+
+def is_ignored(relpath, patterns):
+    return any(fnmatch(relpath, pattern) for pattern in patterns)
+
+
+def write_json_atomically(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def calculate_file_sha256(path):
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for byte_block in iter(lambda: f.read(65536), b""):
+            file_hash.update(byte_block)
+    return file_hash.hexdigest()
+
+
+class FingerprintIndex:
+    """
+    Persistent index of size, mtime and sha256 of every file of local source trees.
+    Content of file is hashed again only if its size or mtime has changed since previous scan.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(conanex_home(), "fingerprints")
+
+    def index_path(self, path):
+        return os.path.join(self.root, "trees", hashlib.sha1(os.path.abspath(path).encode()).hexdigest() + ".json")
+
+    def built_path(self, reference):
+        return os.path.join(self.root, "built", hashlib.sha1(reference.encode()).hexdigest() + ".json")
+
+    def scan(self, path, update=True):
+        index_path = self.index_path(path)
+        index = read_json(index_path, {})
+        previous_files = index.get('files', {})
+        # mtime of file modified during previous scan could be equal to mtime of next modification
+        previous_scan_ns = index.get('scanned_ns', 0)
+        scanned_ns = time.time_ns()
+
+        files = {}
+        for root, dirs, filenames in os.walk(path):
+            relroot = os.path.relpath(root, path).replace(os.sep, '/')
+            relroot = '' if relroot == '.' else relroot + '/'
+            dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS and not is_ignored(relroot + d, IGNORED_PATHS))
+            for filename in filenames:
+                relpath = relroot + filename
+                if is_ignored(relpath, IGNORED_FILES):
+                    continue
+                file_path = os.path.join(root, filename)
+                try:
+                    file_stat = os.stat(file_path)
+                except OSError:
+                    continue
+                previous = previous_files.get(relpath)
+                if previous and previous[0] == file_stat.st_size and previous[1] == file_stat.st_mtime_ns \
+                        and file_stat.st_mtime_ns < previous_scan_ns:
+                    file_hash = previous[2]
+                else:
+                    file_hash = calculate_file_sha256(file_path)
+                files[relpath] = [file_stat.st_size, file_stat.st_mtime_ns, file_hash]
+
+        digest = hashlib.sha256()
+        for relpath in sorted(files):
+            digest.update("{}\0{}\n".format(relpath, files[relpath][2]).encode())
+        digest = digest.hexdigest()
+        if update:
+            write_json_atomically(index_path, {'path': os.path.abspath(path), 'scanned_ns': scanned_ns,
+                                               'files': files, 'digest': digest})
+        return digest
+
+    def built_digest(self, reference):
+        return read_json(self.built_path(reference), {}).get('digest')
+
+    def record_built(self, reference, digest):
+        write_json_atomically(self.built_path(reference), {'reference': reference, 'digest': digest})
+
+
+fingerprint_index = FingerprintIndex()
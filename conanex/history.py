@@ -0,0 +1,226 @@
+import os
+import sqlite3
+import time
+
+from contextlib import contextmanager
+
+from conanex.cache import conanex_home
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command TEXT NOT NULL,
+    conanfile TEXT,
+    started REAL NOT NULL,
+    finished REAL,
+    exit_status INTEGER
+);
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    package TEXT NOT NULL,
+    protocol TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    finished REAL NOT NULL,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    source_cache_hit INTEGER NOT NULL DEFAULT 0,
+    bytes_downloaded INTEGER NOT NULL DEFAULT 0,
+    fetch_time REAL NOT NULL DEFAULT 0,
+    hash_time REAL NOT NULL DEFAULT 0,
+    extract_time REAL NOT NULL DEFAULT 0,
+    create_time REAL,
+    exit_status INTEGER,
+    compiler_cache_hits INTEGER NOT NULL DEFAULT 0,
+    compiler_cache_misses INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS packages_package ON packages(package, profile);
+"""
+
+LAST_CREATE_TIME = """(SELECT p.create_time FROM packages p
+                       WHERE p.package = packages.package AND p.profile = packages.profile
+                             AND p.create_time IS NOT NULL
+                       ORDER BY p.finished DESC LIMIT 1)"""
+
+PACKAGE_STATS = ['cache_hit', 'source_cache_hit', 'bytes_downloaded', 'fetch_time', 'hash_time',
+                 'extract_time', 'create_time', 'exit_status', 'compiler_cache_hits', 'compiler_cache_misses']
+
+# Columns that were added after the first version of schema
+ADDED_COLUMNS = [
+    ('compiler_cache_hits', 'INTEGER NOT NULL DEFAULT 0'),
+    ('compiler_cache_misses', 'INTEGER NOT NULL DEFAULT 0'),
+]
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RunHistory:
+    """
+    SQLite database with history of install runs and statistics of every external package in them.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(conanex_home(), "history.db")
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.executescript(SCHEMA)
+        columns = [row['name'] for row in connection.execute("PRAGMA table_info(packages)")]
+        for column, definition in ADDED_COLUMNS:
+            if column not in columns:
+                connection.execute("ALTER TABLE packages ADD COLUMN {} {}".format(column, definition))
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        connection = self.connect()
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def start_run(self, command, conanfile):
+        with self.transaction() as connection:
+            cursor = connection.execute("INSERT INTO runs (command, conanfile, started) VALUES (?, ?, ?)",
+                                        (command, conanfile, time.time()))
+            return cursor.lastrowid
+
+    def finish_run(self, run_id, exit_status):
+        with self.transaction() as connection:
+            connection.execute("UPDATE runs SET finished = ?, exit_status = ? WHERE id = ?",
+                               (time.time(), exit_status, run_id))
+
+    def record_package(self, run_id, package, protocol, profile, stats):
+        # Packages that were not built have no create time and exit status
+        values = [stats.get(name, None if name in ['create_time', 'exit_status'] else 0)
+                  for name in PACKAGE_STATS]
+        with self.transaction() as connection:
+            connection.execute("INSERT INTO packages (run_id, package, protocol, profile, finished, {}) "
+                               "VALUES (?, ?, ?, ?, ?, {})"
+                               .format(', '.join(PACKAGE_STATS), ', '.join('?' * len(PACKAGE_STATS))),
+                               (run_id, package, protocol, profile, time.time(), *values))
+
+    def slowest_packages(self, limit=10):
+        with self.transaction() as connection:
+            return connection.execute("""
+                SELECT package, profile,
+                       COUNT(create_time) AS builds,
+                       AVG(create_time) AS avg_create_time,
+                       MAX(create_time) AS max_create_time,
+                       {} AS last_create_time,
+                       SUM(exit_status != 0) AS failures
+                FROM packages WHERE create_time IS NOT NULL
+                GROUP BY package, profile
+                ORDER BY avg_create_time DESC
+                LIMIT ?""".format(LAST_CREATE_TIME), (limit,)).fetchall()
+
+    def last_create_times(self):
+        # Only successful builds, failed one could stop at any moment
+        with self.transaction() as connection:
+            rows = connection.execute("""
+                SELECT package, profile, create_time FROM packages p
+                WHERE create_time IS NOT NULL AND exit_status = 0
+                      AND finished = (SELECT MAX(finished) FROM packages
+                                      WHERE package = p.package AND profile = p.profile
+                                            AND create_time IS NOT NULL AND exit_status = 0)""").fetchall()
+            return {(row['package'], row['profile']): row['create_time'] for row in rows}
+
+    def package_trend(self, package, limit=10):
+        with self.transaction() as connection:
+            return connection.execute("""
+                SELECT finished, profile, cache_hit, source_cache_hit, bytes_downloaded,
+                       fetch_time, hash_time, extract_time, create_time, exit_status,
+                       compiler_cache_hits, compiler_cache_misses
+                FROM packages WHERE package = ?
+                ORDER BY finished DESC
+                LIMIT ?""", (package, limit)).fetchall()
+
+    def compiler_cache_rates(self, limit=10):
+        with self.transaction() as connection:
+            return connection.execute("""
+                SELECT package, profile,
+                       COUNT(*) AS builds,
+                       SUM(compiler_cache_hits) AS hits,
+                       SUM(compiler_cache_misses) AS misses,
+                       (SELECT p.compiler_cache_hits FROM packages p
+                        WHERE p.package = packages.package AND p.profile = packages.profile
+                              AND p.compiler_cache_hits + p.compiler_cache_misses > 0
+                        ORDER BY p.finished DESC LIMIT 1) AS last_hits,
+                       (SELECT p.compiler_cache_misses FROM packages p
+                        WHERE p.package = packages.package AND p.profile = packages.profile
+                              AND p.compiler_cache_hits + p.compiler_cache_misses > 0
+                        ORDER BY p.finished DESC LIMIT 1) AS last_misses
+                FROM packages WHERE compiler_cache_hits + compiler_cache_misses > 0
+                GROUP BY package, profile
+                ORDER BY misses DESC
+                LIMIT ?""", (limit,)).fetchall()
+
+    def cache_summary(self):
+        with self.transaction() as connection:
+            return connection.execute("""
+                SELECT COUNT(*) AS total,
+                       COALESCE(SUM(cache_hit), 0) AS cache_hits,
+                       COALESCE(SUM(source_cache_hit), 0) AS source_cache_hits,
+                       COALESCE(SUM(bytes_downloaded), 0) AS bytes_downloaded
+                FROM packages""").fetchone()
+
+    def package_totals(self):
+        with self.transaction() as connection:
+            return connection.execute("""
+                SELECT package, profile,
+                       COUNT(create_time) AS builds,
+                       SUM(exit_status IS NOT NULL AND exit_status != 0) AS failures,
+                       SUM(cache_hit) AS cache_hits,
+                       SUM(1 - cache_hit) AS cache_misses,
+                       SUM(bytes_downloaded) AS bytes_downloaded,
+                       SUM(compiler_cache_hits) AS compiler_cache_hits,
+                       SUM(compiler_cache_misses) AS compiler_cache_misses,
+                       {} AS last_create_time
+                FROM packages
+                GROUP BY package, profile
+                ORDER BY package, profile""".format(LAST_CREATE_TIME)).fetchall()
+
+    def write_openmetrics(self, path):
+        metrics = [
+            ('conanex_package_builds', 'counter', 'Number of conan create runs of package', 'builds'),
+            ('conanex_package_build_failures', 'counter', 'Number of failed conan create runs of package', 'failures'),
+            ('conanex_package_cache_hits', 'counter', 'Number of installs where package was found in conan cache',
+             'cache_hits'),
+            ('conanex_package_cache_misses', 'counter', 'Number of installs where package was not in conan cache',
+             'cache_misses'),
+            ('conanex_package_downloaded_bytes', 'counter', 'Number of bytes downloaded for package sources',
+             'bytes_downloaded'),
+            ('conanex_package_compiler_cache_hits', 'counter', 'Number of compilations of package that hit '
+             'compiler cache', 'compiler_cache_hits'),
+            ('conanex_package_compiler_cache_misses', 'counter', 'Number of compilations of package that missed '
+             'compiler cache', 'compiler_cache_misses'),
+            ('conanex_package_last_create_duration_seconds', 'gauge', 'Duration of last conan create of package',
+             'last_create_time'),
+        ]
+        totals = self.package_totals()
+        lines = []
+        for name, metric_type, help_text, column in metrics:
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            lines.append("# HELP {} {}".format(name, help_text))
+            sample_name = "{}_total".format(name) if metric_type == 'counter' else name
+            for row in totals:
+                if row[column] is None:
+                    continue
+                lines.append('{}{{package="{}",profile="{}"}} {}'.format(sample_name,
+                                                                        escape_label(row['package']),
+                                                                        escape_label(row['profile']),
+                                                                        row[column]))
+        lines.append("# EOF")
+
+        # Textfile collector could read file at any moment, so it is replaced atomically
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+run_history = RunHistory()
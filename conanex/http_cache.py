@@ -0,0 +1,96 @@
+import hashlib
+import os
+import tempfile
+
+from conanex.cache import conanex_home
+from conanex.fingerprint import read_json, write_json_atomically
+
+
+class HttpMetadataCache:
+    """
+    ETag and Last-Modified of files downloaded without declared hash, keyed by url,
+    together with sha256 of content they were sent with.
+    It allows to revalidate previous download by conditional request instead of downloading it again.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(conanex_home(), "http")
+
+    def metadata_path(self, url):
+        return os.path.join(self.root, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+    def lookup(self, url):
+        metadata = read_json(self.metadata_path(url), None)
+        if metadata and metadata.get('url') == url:
+            return metadata
+        return None
+
+    def store(self, url, headers, sha256):
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        write_json_atomically(self.metadata_path(url), {'url': url, 'etag': etag,
+                                                        'last_modified': last_modified, 'sha256': sha256})
+
+    @staticmethod
+    def conditional_headers(metadata):
+        headers = {}
+        if metadata and metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata and metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+        return headers
+
+
+class PartialDownloads:
+    """
+    Files whose download was interrupted, keyed by url, together with strong ETag or Last-Modified
+    of response they were downloaded from. Next download of url continues them with Range request.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(conanex_home(), "downloads")
+
+    def partial_path(self, url):
+        return os.path.join(self.root, hashlib.sha1(url.encode()).hexdigest() + ".part")
+
+    def start(self, url, headers):
+        etag = headers.get('ETag')
+        validator = etag if etag and not etag.startswith('W/') else headers.get('Last-Modified')
+        metadata_path = self.partial_path(url) + ".json"
+        if validator:
+            write_json_atomically(metadata_path, {'url': url, 'validator': validator})
+        elif os.path.exists(metadata_path):
+            os.remove(metadata_path)
+
+    def claim(self, url):
+        """
+        Returns (filename, validator for If-Range) of staging file in downloads folder, download of url is written
+        to it. It contains partial download of previous attempt if validator is not None.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        # Staging file is on the same filesystem as partial downloads, so they are moved by rename
+        fd, filename = tempfile.mkstemp(prefix=".tmp-", dir=self.root)
+        os.close(fd)
+        metadata = read_json(self.partial_path(url) + ".json", None)
+        if not metadata or metadata.get('url') != url:
+            return filename, None
+        try:
+            # Rename is atomic, so partial download is continued by only one process
+            os.replace(self.partial_path(url), filename)
+        except OSError:
+            return filename, None
+        return filename, metadata['validator']
+
+    def discard(self, url):
+        for path in [self.partial_path(url), self.partial_path(url) + ".json"]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def keep(self, url, filename):
+        if os.path.isfile(filename) and os.path.getsize(filename) > 0:
+            os.replace(filename, self.partial_path(url))
+
+http_cache = HttpMetadataCache()
+partial_downloads = PartialDownloads()
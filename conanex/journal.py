@@ -0,0 +1,36 @@
+import os
+import threading
+
+from conanex.fingerprint import read_json, write_json_atomically
+
+JOURNAL_FILE = ".conanex-journal.json"
+
+
+class InstallJournal:
+    """
+    Checkpoint of install that has not finished yet: status of every external package for every profile.
+    Packages that were installed before install failed are not checked again when it is rerun,
+    journal is removed once all packages are installed.
+    """
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, JOURNAL_FILE)
+        self.lock = threading.Lock()
+        self.profiles = read_json(self.path, {}).get('profiles', {})
+
+    def is_installed(self, spec, profile):
+        return self.profiles.get(profile, {}).get(spec, {}).get('status') == 'installed'
+
+    def record(self, spec, profile, status, error=None):
+        with self.lock:
+            entry = {'status': status}
+            if error is not None:
+                entry['error'] = str(error)
+            self.profiles.setdefault(profile, {})[spec] = entry
+            write_json_atomically(self.path, {'profiles': self.profiles})
+
+    def remove(self):
+        with self.lock:
+            self.profiles = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
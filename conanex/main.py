@@ -1,22 +1,40 @@
 import copy
+import glob
 import hashlib
+import json
 import os
 import re
 import shutil
 import tarfile
+import sqlite3
 import tempfile
+import threading
+import time
 import argparse
 import sys
 
+from contextlib import contextmanager
 from enum import Enum
-from io import BytesIO
+from functools import partial
 from pathlib import Path
-from subprocess import Popen, PIPE, DEVNULL
+from subprocess import Popen, PIPE, DEVNULL, TimeoutExpired
 from typing import List, Dict
 from urllib.parse import urlparse
-from urllib.request import urlopen
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen, Request
 from zipfile import ZipFile
 
+from conanex.bundle import Bundle, BundleWriter, package_spec
+from conanex.cache import source_cache, materialize_tree
+from conanex.compiler_cache import CMAKE_EXTRA_VARIABLES_CONF, find_compiler_cache
+from conanex.fingerprint import fingerprint_index
+from conanex.history import run_history
+from conanex.journal import InstallJournal
+from conanex.output import ContextThreadPoolExecutor, write_output, is_redirected
+from conanex.http_cache import http_cache, partial_downloads
+from conanex.resolved import resolved_sources
+from conanex.schedule import BuildScheduler, network_limits, cpu_slots
+
 nenv = copy.copy(os.environ)
 paths = nenv["PATH"].split(os.pathsep)
 npaths = []
@@ -25,6 +43,11 @@ for path in paths:
         npaths.append(path)
 nenv["PATH"] = os.pathsep.join(npaths)
 
+fetch_jobs = 8
+fetch_jobs_per_host = 4
+# Threads only wait for network slots, see NetworkLimits
+fetch_threads = 64
+
 detect_external_package = r"(?P<package>(-|\w)+)(\/(?P<version>[.\d\w]+))?(@((?P<user>\w+)\/(?P<channel>\w+))?)?\s*\{"
 detect_external_package_re = re.compile(detect_external_package)
 external_package_property = r"^\s*(?P<property>.+?)\s*=\s*(?P<value>.+?)\s*$"
@@ -35,12 +58,22 @@ option = r"\s*(?P<name>.*?)\s*:\s*(?P<option>.*?)\s*=\s*(?P<value>.*)"
 option_re = re.compile(option)
 
 
+class CommandException(Exception):
+    def __init__(self, command, exit_code):
+        super().__init__(f"Failed command\n{' '.join(command)}")
+        self.command = command
+        self.exit_code = exit_code
+
+
 class ConanArgs:
     def __init__(self, args):
         self.__dict__['_args'] = args
 
     def __copy__(self):
-        return ConanArgs(self.__dict__['_args'])
+        args = ConanArgs(self.__dict__['_args'])
+        # Values set on this object (profile of matrix entry, output folder of component) are kept by copy
+        args.__dict__.update(self.__dict__)
+        return args
 
     def __getattr__(self, name):
         if name == '_args':
@@ -67,6 +100,17 @@ class ExternalPackage:
         self.url = url
         self.attrs = dict(kwargs)
         self.options = []
+        self.stats = {}
+        # Digest of sources that package is built from, used to detect changes of sources
+        self.source_digest = None
+
+    @contextmanager
+    def measure(self, stat):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stats[stat] = self.stats.get(stat, 0.0) + time.monotonic() - started
 
     @property
     def package_name(self):
@@ -90,6 +134,21 @@ class ExternalPackage:
             hash_algo = 'sha512'
         return hash_algo
 
+    def get_attr(self, name, default=None):
+        if name not in self.attrs:
+            return default
+        return self.attrs[name].strip("'").strip('"')
+
+    @property
+    def package_subdir(self):
+        subdir = self.get_attr("subdir")
+        if not subdir:
+            return None
+        subdir = Path(subdir).as_posix().strip('/')
+        if Path(subdir).is_absolute() or '..' in Path(subdir).parts:
+            raise Exception("subdir[{}] should be relative path inside of package sources".format(subdir))
+        return subdir
+
     @property
     def package_hash_code(self):
         hash = None
@@ -169,7 +228,7 @@ def parse_install_args():
     install_parser.add_argument('-d', '--deployer', type=str, help='DEPLOYER')
     install_parser.add_argument('-b', '--build', type=str, nargs='?', const='default', help='BUILD')
     install_parser.add_argument('-r', '--remote', type=str, help='REMOTE')
-    install_parser.add_argument('-nr', '--no-remote', type=str, help='NO_REMOTE')
+    install_parser.add_argument('-nr', '--no-remote', action='store_true')
     install_parser.add_argument('-u', '--update', action='store_true')
     install_parser.add_argument('-l', '--lockfile', type=str, help='LOCKFILE')
     install_parser.add_argument('--lockfile-partial', type=str, help='LOCKFILE_PARTIAL')
@@ -193,11 +252,81 @@ def parse_install_args():
     install_parser.add_argument('-c:b', '--conf:build', type=str, action='append', nargs='+', help='CONF_BUILD')
     install_parser.add_argument('-c:h', '--conf:host', type=str, action='append', nargs='+', help='CONF_HOST')
     install_parser.add_argument('-c:a', '--conf:all', type=str, action='append', nargs='+', help='CONF_ALL')
-    install_parser.add_argument('path_or_reference', type=str)
+    install_parser.add_argument('--external-jobs', type=int, default=1, help='EXTERNAL_JOBS')
+    install_parser.add_argument('--matrix-profile', type=str, action='append', help='MATRIX_PROFILE')
+    install_parser.add_argument('--matrix-settings', type=str, action='append', help='MATRIX_SETTINGS')
+    install_parser.add_argument('--from-bundle', type=str, help='FROM_BUNDLE')
+    install_parser.add_argument('--workspace', type=str, help='WORKSPACE_DIR_OR_GLOB')
+    install_parser.add_argument('--fetch-jobs', type=int, help='FETCH_JOBS')
+    install_parser.add_argument('--fetch-jobs-per-host', type=int, help='FETCH_JOBS_PER_HOST')
+    install_parser.add_argument('--offline', action='store_true')
+    install_parser.add_argument('--keep-going', action='store_true')
+    install_parser.add_argument('--compiler-cache', type=str, choices=['ccache'])
+    install_parser.add_argument('--plan', action='store_true')
+    install_parser.add_argument('--plan-format', type=str, default='text', choices=['text', 'json'])
+    install_parser.add_argument('path_or_reference', type=str, nargs='?')
     install_parser.add_argument('reference', type=str, nargs='?')
     return parser.parse_args()
 
 
+def parse_stats_args():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+    stats_parser = subparsers.add_parser('stats')
+    stats_parser.add_argument('-n', '--limit', type=int, default=10, help='LIMIT')
+    stats_parser.add_argument('-p', '--package', type=str, help='PACKAGE')
+    stats_parser.add_argument('--openmetrics', type=str, help='OPENMETRICS_TEXTFILE')
+    return parser.parse_args()
+
+
+def get_arg_values(args, name):
+    values = getattr(args, name, None)
+    if not values:
+        return []
+    if isinstance(values, str):
+        return [values]
+    flat_values = []
+    for value in values:
+        if isinstance(value, str):
+            flat_values.append(value)
+        else:
+            flat_values.extend(value)
+    return flat_values
+
+
+def parse_fetch_args():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+    fetch_parser = subparsers.add_parser('fetch')
+    fetch_parser.add_argument('--only-recipe', action='store_true')
+    fetch_parser.add_argument('-p', '--package-query', type=str, help='PACKAGE_QUERY')
+    fetch_parser.add_argument('--workspace', type=str, help='WORKSPACE_DIR_OR_GLOB')
+    fetch_parser.add_argument('--fetch-jobs', type=int, help='FETCH_JOBS')
+    fetch_parser.add_argument('--fetch-jobs-per-host', type=int, help='FETCH_JOBS_PER_HOST')
+    fetch_parser.add_argument('path_or_reference', type=str, nargs='?')
+    return parser.parse_args()
+
+
+def parse_bundle_args():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+    bundle_parser = subparsers.add_parser('bundle')
+    bundle_subparsers = bundle_parser.add_subparsers(dest="bundle_command", required=True)
+    create_parser = bundle_subparsers.add_parser('create')
+    create_parser.add_argument('-o', '--output', type=str, default='conanex-bundle.zip', help='OUTPUT')
+    create_parser.add_argument('--only-recipe', action='store_true')
+    create_parser.add_argument('-p', '--package-query', type=str, help='PACKAGE_QUERY')
+    create_parser.add_argument('--fetch-jobs', type=int, help='FETCH_JOBS')
+    create_parser.add_argument('--fetch-jobs-per-host', type=int, help='FETCH_JOBS_PER_HOST')
+    create_parser.add_argument('path_or_reference', type=str)
+    return parser.parse_args()
+
+
+def is_remote_disabled(args):
+    # Offline install and install from bundle should not reach remotes from conan create and conan install either
+    return args.no_remote or args.offline or bool(args.from_bundle)
+
+
 def build_install_args(args, path_or_reference: ExternalPackage | str):
     new_args = ['install']
 
@@ -274,12 +403,11 @@ def build_install_args(args, path_or_reference: ExternalPackage | str):
         if args.build != "default":
             new_args.append(args.build)
 
-    if args.remote:
+    if is_remote_disabled(args):
+        new_args.append('--no-remote')
+    elif args.remote:
         new_args.append('-r')
         new_args.append(args.remote)
-    if args.no_remote:
-        new_args.append('-nr')
-        new_args.append(args.no_remote)
 
     if args.lockfile:
         new_args.append('-l')
@@ -313,48 +441,15 @@ def build_install_args(args, path_or_reference: ExternalPackage | str):
         new_args.append('-pr:a')
         new_args.append(getattr(args, 'profile:all'))
 
-    if args.settings:
-        for setting in args.settings:
-            new_args.append('-s')
-            new_args.append(setting)
-    if hasattr(args, 'settings:build') and getattr(args, 'settings:build'):
-        for setting in getattr(args, 'settings:build'):
-            new_args.append('-s:b')
-            new_args.append(setting)
-    if hasattr(args, 'settings:host') and getattr(args, 'settings:host'):
-        for setting in getattr(args, 'settings:host'):
-            new_args.append('-s:h')
-            new_args.append(setting)
-    if hasattr(args, 'settings:all') and getattr(args, 'settings:all'):
-        for setting in getattr(args, 'settings:all'):
-            new_args.append('-s:a')
-            new_args.append(setting)
-
-    if hasattr(args, 'options:build') and getattr(args, 'options:build'):
-        for option in getattr(args, 'options:build'):
-            new_args.append('-s:b')
-            new_args.append(option)
-    if hasattr(args, 'options:host') and getattr(args, 'options:host'):
-        for option in getattr(args, 'options:host'):
-            new_args.append('-s:h')
-            new_args.append(option)
-    if hasattr(args, 'options:all') and getattr(args, 'options:all'):
-        for setting in getattr(args, 'options:all'):
-            new_args.append('-s:a')
-            new_args.append(setting)
-
-    if args.conf:
-        new_args.append('-c')
-        new_args.append(args.conf)
-    if hasattr(args, 'conf:build') and getattr(args, 'conf:build'):
-        new_args.append('-c:b')
-        new_args.append(getattr(args, 'conf:build'))
-    if hasattr(args, 'conf:host') and getattr(args, 'conf:host'):
-        new_args.append('-c:h')
-        new_args.append(getattr(args, 'conf:host'))
-    if hasattr(args, 'conf:all') and getattr(args, 'conf:all'):
-        new_args.append('-c:a')
-        new_args.append(getattr(args, 'conf:all'))
+    for name, flag in [('settings', '-s'), ('settings:build', '-s:b'),
+                       ('settings:host', '-s:h'), ('settings:all', '-s:a'),
+                       ('options', '-o'), ('options:build', '-o:b'),
+                       ('options:host', '-o:h'), ('options:all', '-o:a'),
+                       ('conf', '-c'), ('conf:build', '-c:b'),
+                       ('conf:host', '-c:h'), ('conf:all', '-c:a')]:
+        for value in get_arg_values(args, name):
+            new_args.append(flag)
+            new_args.append(value)
 
     if isinstance(path_or_reference, ExternalPackage):
         new_args.append(f'--requires={path_or_reference.full_package_name}')
@@ -396,12 +491,11 @@ def build_create_args(args, tmpdirname, package: ExternalPackage):
         if args.build != "default":
             new_args.append(args.build)
 
-    if args.remote:
+    if is_remote_disabled(args):
+        new_args.append('--no-remote')
+    elif args.remote:
         new_args.append('-r')
         new_args.append(args.remote)
-    if args.no_remote:
-        new_args.append('-nr')
-        new_args.append(args.no_remote)
 
     if args.lockfile:
         new_args.append('-l')
@@ -435,48 +529,15 @@ def build_create_args(args, tmpdirname, package: ExternalPackage):
         new_args.append('-pr:a')
         new_args.append(getattr(args, 'profile:all'))
 
-    if args.settings:
-        for setting in args.settings:
-            new_args.append('-s')
-            new_args.append(setting)
-    if hasattr(args, 'settings:build') and getattr(args, 'settings:build'):
-        for setting in getattr(args, 'settings:build'):
-            new_args.append('-s:b')
-            new_args.append(setting)
-    if hasattr(args, 'settings:host') and getattr(args, 'settings:host'):
-        for setting in getattr(args, 'settings:host'):
-            new_args.append('-s:h')
-            new_args.append(setting)
-    if hasattr(args, 'settings:all') and getattr(args, 'settings:all'):
-        for setting in getattr(args, 'settings:all'):
-            new_args.append('-s:a')
-            new_args.append(setting)
-
-    if hasattr(args, 'options:build') and getattr(args, 'options:build'):
-        for option in getattr(args, 'options:build'):
-            new_args.append('-s:b')
-            new_args.append(option)
-    if hasattr(args, 'options:host') and getattr(args, 'options:host'):
-        for option in getattr(args, 'options:host'):
-            new_args.append('-s:h')
-            new_args.append(option)
-    if hasattr(args, 'options:all') and getattr(args, 'options:all'):
-        for setting in getattr(args, 'options:all'):
-            new_args.append('-s:a')
-            new_args.append(setting)
-
-    if args.conf:
-        new_args.append('-c')
-        new_args.append(args.conf)
-    if hasattr(args, 'conf:build') and getattr(args, 'conf:build'):
-        new_args.append('-c:b')
-        new_args.append(getattr(args, 'conf:build'))
-    if hasattr(args, 'conf:host') and getattr(args, 'conf:host'):
-        new_args.append('-c:h')
-        new_args.append(getattr(args, 'conf:host'))
-    if hasattr(args, 'conf:all') and getattr(args, 'conf:all'):
-        new_args.append('-c:a')
-        new_args.append(getattr(args, 'conf:all'))
+    for name, flag in [('settings', '-s'), ('settings:build', '-s:b'),
+                       ('settings:host', '-s:h'), ('settings:all', '-s:a'),
+                       ('options', '-o'), ('options:build', '-o:b'),
+                       ('options:host', '-o:h'), ('options:all', '-o:a'),
+                       ('conf', '-c'), ('conf:build', '-c:b'),
+                       ('conf:host', '-c:h'), ('conf:all', '-c:a')]:
+        for value in get_arg_values(args, name):
+            new_args.append(flag)
+            new_args.append(value)
 
     new_args.append(tmpdirname)
     return new_args
@@ -484,26 +545,115 @@ def build_create_args(args, tmpdirname, package: ExternalPackage):
 
 def run_git_clone_command(tag, tmpdirname, url):
     if tag:
-        git_clone_command = ["git", "clone", "--recursive", '-b', tag, url, tmpdirname]
+        git_clone_command = ["git", "clone", '-b', tag, url, tmpdirname]
     else:
-        git_clone_command = ["git", "clone", "--recursive", url, tmpdirname]
+        git_clone_command = ["git", "clone", url, tmpdirname]
+    run_command(git_clone_command)
+
+
+def run_git_submodule_update_command(tmpdirname):
+    # Submodules that were cloned by interrupted attempt are not cloned again
+    run_command(["git", "-C", tmpdirname, "submodule", "update", "--init", "--recursive"])
+
+
+def run_git_sparse_clone_command(tag, tmpdirname, url):
+    git_clone_command = ["git", "clone", "--depth", "1", "--filter=blob:none", "--sparse"]
+    if tag:
+        git_clone_command.extend(['-b', tag])
+    git_clone_command.extend([url, tmpdirname])
     run_command(git_clone_command)
 
 
-def run_command(command):
-    print(' '.join(command))
-    process = Popen(command, stdout=PIPE, env=nenv)
-    process.communicate()
+def run_git_sparse_checkout_command(tmpdirname, subdir):
+    run_command(["git", "-C", tmpdirname, "sparse-checkout", "set", subdir])
+
+
+def get_git_head(dirname):
+    """ Commit checked out in dirname or None if there is no complete clone in it """
+    if not os.path.isdir(os.path.join(dirname, ".git")):
+        return None
+    try:
+        return run_command_output(["git", "-C", dirname, "rev-parse", "HEAD"]).strip()
+    except CommandException:
+        return None
+
+
+def resolve_git_commit(tag, url):
+    ls_remote_command = ["git", "ls-remote", url, *([tag, f"{tag}^{{}}"] if tag else ["HEAD"])]
+    refs = {}
+    for line in run_command_output(ls_remote_command).splitlines():
+        commit, _, ref = line.partition("\t")
+        refs[ref] = commit
+    if tag:
+        for ref in [f"refs/tags/{tag}^{{}}", f"refs/tags/{tag}", f"refs/heads/{tag}"]:
+            if ref in refs:
+                return refs[ref]
+    elif "HEAD" in refs:
+        return refs["HEAD"]
+    raise Exception("Could not resolve '{}' in git repository {}".format(tag if tag else "HEAD", url))
+
+
+def write_command_errors(errors):
+    # Output of conan and git goes to stderr, it is passed to output handler when output is redirected
+    if errors:
+        write_output(errors.decode(errors='replace').rstrip('\n'))
+
+
+def run_command(command, env=None):
+    write_output(' '.join(command))
+    process = Popen(command, stdout=PIPE, stderr=PIPE if is_redirected() else None, env=env or nenv)
+    _, errors = process.communicate()
+    write_command_errors(errors)
     exit_code = process.wait()
     if exit_code != 0:
-        raise Exception(f"Failed command\n{' '.join(command)}")
+        raise CommandException(command, exit_code)
+
+
+def run_command_output(command):
+    write_output(' '.join(command))
+    with Popen(command, stdout=PIPE, stderr=PIPE if is_redirected() else None, env=nenv) as proc:
+        output, errors = proc.communicate()
+        write_command_errors(errors)
+        if proc.returncode != 0:
+            raise CommandException(command, proc.returncode)
+        return output.decode()
+
+
+def with_compiler_launcher(args, compiler_cache):
+    launcher_args = copy.copy(args)
+    launchers = {'CMAKE_C_COMPILER_LAUNCHER': compiler_cache.executable,
+                 'CMAKE_CXX_COMPILER_LAUNCHER': compiler_cache.executable}
+    # Variables are added to ones that could be set in profile
+    for name in ['conf', 'conf:build']:
+        setattr(launcher_args, name, get_arg_values(args, name) + ["{}*={}".format(CMAKE_EXTRA_VARIABLES_CONF,
+                                                                                     launchers)])
+    return launcher_args
+
+
+@contextmanager
+def open_compiler_cache_session(compiler_cache, package: ExternalPackage):
+    """ Yields environment of conan create """
+    if compiler_cache is None:
+        yield nenv
+        return
+    with compiler_cache.session(package.stats) as env:
+        yield dict(nenv, **env)
 
 
 def run_conan_create_command(args, package: ExternalPackage, tmpdirname):
-    print("\nBuilding {} from sources:".format(package.full_package_name))
+    write_output("\nBuilding {} from sources:".format(package.full_package_name))
+    compiler_cache = find_compiler_cache(args.compiler_cache) if args.compiler_cache else None
+    if compiler_cache is not None:
+        args = with_compiler_launcher(args, compiler_cache)
     create_args = build_create_args(args, tmpdirname, package)
     conan_create_command = [sys.executable, "-m", "conans.conan", *create_args]
-    run_command(conan_create_command)
+    with package.measure('create_time'), open_compiler_cache_session(compiler_cache, package) as env:
+        try:
+            run_command(conan_create_command, env)
+            package.stats['exit_status'] = 0
+        except CommandException as e:
+            package.stats['exit_status'] = e.exit_code
+            raise
 
 
 def run_conan_install_command(args, path_or_reference):
@@ -528,38 +678,22 @@ def create_hash_algo(hash_algo):
     return hash
 
 
-def calculate_bytes_io_hash(filename: BytesIO, hash):
-    # Read and update hash string value in blocks of 4K
-    for byte_block in iter(lambda: filename.read(4096), b""):
-        hash.update(byte_block)
-    return hash.hexdigest().lower()
-
-
-def calculate_file_hash(filename, hash):
-    with open(filename, "rb") as f:
-        # Read and update hash string value in blocks of 4K
-        for byte_block in iter(lambda: f.read(4096), b""):
-            hash.update(byte_block)
-        return hash.hexdigest().lower()
-
-
-def verify_hash_code(file: str | BytesIO, package: ExternalPackage):
-    if package.package_hash_algo:
-        if type(file) == BytesIO:
-            hash_code = calculate_bytes_io_hash(copy.copy(file), create_hash_algo(package.package_hash_algo))
-        else:
-            hash_code = calculate_file_hash(file, create_hash_algo(package.package_hash_algo))
-        if package.package_hash_code != hash_code:
-            raise Exception("Calculated hash code '{}' of {} file is not equal to {}"
-                            .format(hash_code, file, package.package_hash_code))
-
-
 def is_package_in_cache(package: ExternalPackage):
-    conan_command = [sys.executable, "-m", "conans.conan", "search", package.package_name]
-    with Popen(conan_command, stdout=PIPE, env=nenv) as proc:
-        search_results, _ = proc.communicate(timeout=15)
-        search_results = str(search_results)
-        return "Existing package recipes:" in search_results
+    reference = package.full_package_name.rstrip('@')
+    conan_command = [sys.executable, "-m", "conans.conan", "list", reference, "--format=json"]
+    with cpu_slots, Popen(conan_command, stdout=PIPE, stderr=DEVNULL, env=nenv) as proc:
+        try:
+            search_results, _ = proc.communicate(timeout=15)
+        except TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            write_output("Check of {} in conan cache has timed out, it is considered missing".format(reference))
+            return False
+    try:
+        search_results = json.loads(search_results)
+    except ValueError:
+        return False
+    return reference in search_results.get("Local Cache", {})
 
 
 def uri_validator(url):
@@ -570,56 +704,281 @@ def uri_validator(url):
         return False
 
 
-def extract_from_zip(tmpdirname, url, package: ExternalPackage):
-    if uri_validator(url):
-        print("wget {}".format(url))
-        resp = urlopen(url)
-        bytes_io = BytesIO(resp.read())
-        verify_hash_code(bytes_io, package)
-        with ZipFile(bytes_io) as zipfile:
-            zipfile.extractall(tmpdirname)
-    else:
-        verify_hash_code(url, package)
-        with ZipFile(url, 'r') as zipfile:
-            zipfile.extractall(tmpdirname)
-
-
-def extract_from_tar(tmpdirname, url, archive, package: ExternalPackage):
-    if uri_validator(url):
-        print("wget {}".format(url))
-        resp = urlopen(url)
-        bytes_io = BytesIO(resp.read())
-        verify_hash_code(bytes_io, package)
-        with tarfile.open(fileobj=bytes_io, mode="r:{}".format(archive)) as tar:
+def calculate_file_hashes(filename, hash_algos):
+    hashes = {hash_algo: create_hash_algo(hash_algo) for hash_algo in hash_algos if hash_algo}
+    with open(filename, "rb") as f:
+        for byte_block in iter(lambda: f.read(65536), b""):
+            for hash in hashes.values():
+                hash.update(byte_block)
+    return {hash_algo: hash.hexdigest().lower() for hash_algo, hash in hashes.items()}
+
+
+def download_file(url, filename, package: ExternalPackage, headers=None, resume_validator=None):
+    """
+    Returns headers of response or None if server responded that file was not modified,
+    with resume_validator download continues content of filename if it was not changed on server
+    """
+    headers = dict(headers or {})
+    offset = os.path.getsize(filename) if resume_validator and os.path.isfile(filename) else 0
+    if offset:
+        headers['Range'] = 'bytes={}-'.format(offset)
+        headers['If-Range'] = resume_validator
+    with network_limits.slot(url):
+        write_output("wget {}".format(url))
+        try:
+            resp = urlopen(Request(url, headers=headers))
+        except HTTPError as e:
+            if e.code == 304:
+                return None
+            if e.code != 416 or not offset:
+                raise
+            # File on server is shorter than partial download, so it is downloaded from the beginning
+            offset = 0
+            resp = urlopen(Request(url))
+        resumed = offset and resp.status == 206
+        if resumed:
+            write_output("Resuming download of {} from {}".format(url, format_bytes(offset)))
+        else:
+            partial_downloads.start(url, resp.headers)
+        received = 0
+        with resp, open(filename, "ab" if resumed else "wb") as f:
+            for byte_block in iter(lambda: resp.read(65536), b""):
+                f.write(byte_block)
+                received += len(byte_block)
+                package.stats['bytes_downloaded'] = package.stats.get('bytes_downloaded', 0) + len(byte_block)
+        # Closed connection ends reading without error, so truncated download is detected by its length
+        expected = resp.headers.get('Content-Length')
+        if expected and received < int(expected):
+            raise Exception("Download of {} was interrupted after {} of {}"
+                            .format(url, format_bytes(offset + received), format_bytes(offset + int(expected))))
+        return resp.headers
+
+
+@contextmanager
+def open_package_file(url, package: ExternalPackage, metadata=None):
+    """ metadata of previous download is used for conditional request, file is None if it was not modified """
+    downloaded = uri_validator(url)
+    filename = url
+    resume_validator = None
+    if downloaded:
+        filename, resume_validator = partial_downloads.claim(url)
+    try:
+        response_headers = None
+        with package.measure('fetch_time'):
+            if downloaded:
+                # Partial download is continued instead of revalidation of previous download
+                conditional_headers = http_cache.conditional_headers(metadata) if resume_validator is None else {}
+                try:
+                    response_headers = download_file(url, filename, package, conditional_headers, resume_validator)
+                except BaseException:
+                    partial_downloads.keep(url, filename)
+                    raise
+                partial_downloads.discard(url)
+        if downloaded and response_headers is None:
+            write_output("{} was not modified since previous download".format(url))
+            yield None, metadata['sha256']
+            return
+        with cpu_slots, package.measure('hash_time'):
+            hashes = calculate_file_hashes(filename, ['sha256', package.package_hash_algo])
+            if package.package_hash_algo and package.package_hash_code != hashes[package.package_hash_algo]:
+                raise Exception("Calculated hash code '{}' of {} file is not equal to {}"
+                                .format(hashes[package.package_hash_algo], url, package.package_hash_code))
+        if response_headers is not None and not package.package_hash_algo:
+            http_cache.store(url, response_headers, hashes['sha256'])
+        yield filename, hashes['sha256']
+    finally:
+        if downloaded and os.path.exists(filename):
+            os.remove(filename)
+
+
+ARCHIVE_SIGNATURES = [
+    (b'PK\x03\x04', 'zip'),
+    (b'PK\x05\x06', 'zip'),
+    (b'\x1f\x8b', 'gz'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zst'),
+]
+
+
+def detect_archive_format(filename):
+    with open(filename, "rb") as f:
+        header = f.read(512)
+    for signature, archive_format in ARCHIVE_SIGNATURES:
+        if header.startswith(signature):
+            return archive_format
+    if header[257:262] == b'ustar':
+        return 'tar'
+    return None
+
+
+def open_zstd_stream(fileobj):
+    try:
+        # Available in standard library since Python 3.14
+        from compression import zstd
+        return zstd.ZstdFile(fileobj)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception("zstandard package is required to extract zstd archives, "
+                        "install it with: python3 -m pip install conanex[zstd]")
+    return zstandard.ZstdDecompressor().stream_reader(fileobj)
+
+
+def extract_from_zip(tmpdirname, filename):
+    with ZipFile(filename) as zipfile:
+        zipfile.extractall(tmpdirname)
+
+
+def extract_from_tar(tmpdirname, filename, archive):
+    # Stream mode decompresses archive on the fly without seeking back
+    with tarfile.open(name=filename, mode="r|{}".format(archive)) as tar:
+        tar.extractall(tmpdirname)
+
+
+def extract_from_tar_zst(tmpdirname, filename):
+    with open(filename, "rb") as f, open_zstd_stream(f) as zstd_stream:
+        with tarfile.open(fileobj=zstd_stream, mode="r|") as tar:
             tar.extractall(tmpdirname)
+
+
+def extract_archive(tmpdirname, filename, url):
+    archive_format = detect_archive_format(filename)
+    if archive_format == 'zip':
+        extract_from_zip(tmpdirname, filename)
+    elif archive_format == 'zst':
+        extract_from_tar_zst(tmpdirname, filename)
+    elif archive_format == 'tar':
+        extract_from_tar(tmpdirname, filename, '')
+    elif archive_format:
+        extract_from_tar(tmpdirname, filename, archive_format)
     else:
-        verify_hash_code(url, package)
-        with tarfile.open(name=url, mode=f'r:{archive}') as tar:
-            tar.extractall(tmpdirname)
+        raise Exception("Unsupported archive format of {}, supported formats are: "
+                        "zip, tar, tar.gz, tar.bz2, tar.xz and tar.zst".format(url))
+
+
+def write_conanfile(tmpdirname, filename):
+    shutil.copyfile(filename, os.path.join(tmpdirname, "conanfile.py"))
+
+
+def find_package_source_dir(dirname):
+    subfolders = [f.path for f in os.scandir(dirname) if f.is_dir()]
+    if len(subfolders) == 1:
+        return subfolders[0]
+    return dirname
+
+
+def fetch_package_file(package: ExternalPackage, kind, unpack):
+    if package.package_hash_algo == 'sha256':
+        source_dir = source_cache.lookup(kind, package.package_hash_code)
+        if source_dir:
+            write_output("{} sources were found in cache".format(package.full_package_name))
+            package.stats['source_cache_hit'] = True
+            return source_dir
+
+    metadata = None
+    if not package.package_hash_algo:
+        # Without declared hash previous download is revalidated only if its sources are still in cache
+        metadata = http_cache.lookup(package.url)
+        if metadata and not source_cache.lookup(kind, metadata['sha256']):
+            metadata = None
+
+    with open_package_file(package.url, package, metadata) as (filename, file_hash):
+        source_dir = source_cache.lookup(kind, file_hash)
+        if source_dir:
+            write_output("{} sources were found in cache".format(package.full_package_name))
+            package.stats['source_cache_hit'] = True
+            return source_dir
+        with cpu_slots, package.measure('extract_time'):
+            return source_cache.store(kind, file_hash, lambda dirname: unpack(dirname, filename))
+
+
+def git_cache_key(commit, subdir):
+    if not subdir:
+        return commit
+    # Sparse checkout contains only subdir, so it is cached separately from full clone
+    return "{}-{}".format(commit, hashlib.sha1(subdir.encode()).hexdigest()[:12])
+
+
+def fetch_package_from_git(package: ExternalPackage):
+    tag = package.get_attr("tag")
+    subdir = package.package_subdir
+    with network_limits.slot(package.url):
+        commit = resolve_git_commit(tag, package.url)
+    cache_key = git_cache_key(commit, subdir)
+    source_dir = source_cache.lookup('git', cache_key)
+    if source_dir:
+        write_output("{} sources were found in cache".format(package.full_package_name))
+        package.stats['source_cache_hit'] = True
+        return source_dir
+
+    def clone(dirname):
+        # Clone of interrupted attempt is continued from the step it has failed on
+        resumed = get_git_head(dirname) == commit
+        with network_limits.slot(package.url):
+            if not resumed:
+                shutil.rmtree(dirname)
+                if subdir:
+                    run_git_sparse_clone_command(tag, dirname, package.url)
+                else:
+                    run_git_clone_command(tag, dirname, package.url)
+            if subdir:
+                run_git_sparse_checkout_command(dirname, subdir)
+            else:
+                run_git_submodule_update_command(dirname)
+        cloned_commit = get_git_head(dirname)
+        if cloned_commit != commit:
+            raise Exception("Repository {} has changed while cloning: expected {}, got {}"
+                            .format(package.url, commit, cloned_commit))
+
+    with package.measure('fetch_time'):
+        return source_cache.store('git', cache_key, clone, resumable=True)
+
+
+def fetch_package_from_zip(package: ExternalPackage):
+    # Format of archive is detected from its content, url could have any extension
+    source_dir = fetch_package_file(package, 'zip',
+                                    lambda dirname, filename: extract_archive(dirname, filename, package.url))
+    return find_package_source_dir(source_dir)
+
+
+def fetch_package_from_conanfile(package: ExternalPackage):
+    if not package.url.endswith("conanfile.py"):
+        raise Exception("Url [{}] should contain conanfile.py".format(package.url))
+    return fetch_package_file(package, 'conan', write_conanfile)
+
+
+def resolve_package_path(package: ExternalPackage, conanfile_path):
+    conanfile_posix_path = Path(conanfile_path).as_posix()
+    if not Path(package.url).is_absolute():
+        return str(Path("{}/{}".format(conanfile_posix_path, package.url)))
+    return package.url
+
+
+def get_package_recipe_dir(dirname, package: ExternalPackage):
+    if not package.package_subdir:
+        return dirname
+    recipe_dir = os.path.join(dirname, package.package_subdir)
+    if not os.path.isdir(recipe_dir):
+        raise Exception("subdir[{}] was not found in {} sources".format(package.package_subdir,
+                                                                       package.full_package_name))
+    return recipe_dir
+
+
+def install_package_from_sources(args, package: ExternalPackage, source_dir):
+    with source_cache.open_work_dir() as tmpdirname:
+        materialize_tree(source_dir, tmpdirname)
+        run_conan_create_command(args, package, get_package_recipe_dir(tmpdirname, package))
 
 
 def install_package_from_git(args, package: ExternalPackage):
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        run_git_clone_command(package.attrs["tag"], tmpdirname, package.url)
-        run_conan_create_command(args, package, tmpdirname)
+    install_package_from_sources(args, package, fetch_package_from_git(package))
 
 
 def install_package_from_zip(args, package: ExternalPackage):
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        filename, file_ext = os.path.splitext(package.url)
-        file_ext = file_ext[1:]
-        if file_ext == 'zip':
-            extract_from_zip(tmpdirname, package.url, package)
-        elif os.path.splitext(filename)[1][1:] == 'tar':
-            extract_from_tar(tmpdirname, package.url, file_ext, package)
-
-        subfolders = [f.path for f in os.scandir(tmpdirname) if f.is_dir()]
-        if len(subfolders) == 1:
-            src_package_dir = subfolders[0]
-        else:
-            src_package_dir = tmpdirname
-
-        run_conan_create_command(args, package, src_package_dir)
+    install_package_from_sources(args, package, fetch_package_from_zip(package))
 
 
 def install_package_from_path(args, package: ExternalPackage, path: str):
@@ -627,21 +986,7 @@ def install_package_from_path(args, package: ExternalPackage, path: str):
 
 
 def install_package_from_conanfile(args, package: ExternalPackage):
-    if not package.url.endswith("conanfile.py"):
-        raise Exception("Url [{}] should contain conanfile.py".format(package.url))
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        if uri_validator(package.url):
-            print("wget {}".format(package.url))
-            resp = urlopen(package.url)
-            new_conanfile_path = os.path.join(tmpdirname, "conanfile.py")
-            bytes_io = BytesIO(resp.read())
-            with open(new_conanfile_path, "wb") as f:
-                f.write(bytes_io.getbuffer())
-            verify_hash_code(new_conanfile_path, package)
-        else:
-            shutil.copy2(package.url, tmpdirname)
-
-        run_conan_create_command(args, package, tmpdirname)
+    install_package_from_sources(args, package, fetch_package_from_conanfile(package))
 
 
 def install_package_from_remote(args, package: ExternalPackage):
@@ -652,7 +997,58 @@ def install_package_from_remote(args, package: ExternalPackage):
 
 def is_command_to_modify():
     return 'install' in sys.argv or \
-           'info' in sys.argv
+           'info' in sys.argv or \
+           'stats' in sys.argv or \
+           'bundle' in sys.argv or \
+           'fetch' in sys.argv
+
+
+def parse_external_package(external_package_str):
+    external_package_match = detect_external_package_re.match(external_package_str)
+    if not external_package_match:
+        raise Exception("external package should be specified in following format: "
+                        "package/version {{ protocol = url }}, got:\n{}".format(external_package_str))
+
+    start_props = external_package_str.find('{') + 1
+    end_props = external_package_str.find('}', start_props)
+    external_package_props_str = external_package_str[start_props:end_props]
+    props_str = external_package_props_str.split(',')
+    properties = {}
+    for prop in props_str:
+        external_package_property_match = external_package_property_re.match(prop)
+        if not external_package_property_match:
+            continue
+        properties[external_package_property_match.group('property')] = external_package_property_match.group('value')
+
+    name = external_package_match.group('package')
+    version = external_package_match.group('version')
+    if not name or not version:
+        raise Exception("name and version of package is required !!"
+                        "Please, specify it in following format: package/version")
+    user = external_package_match.group('user')
+    channel = external_package_match.group('channel')
+    protocols = []
+    for prot in ["git", "zip", "conan", "remote", "path"]:
+        if prot in properties:
+            protocols.append(prot)
+
+    if len(protocols) == 0:
+        raise Exception("No protocols where found. Protocol should be specified from the following list: {}"
+                        .format(protocols))
+    if len(protocols) > 1:
+        raise Exception("From the following list, only single protocol should be specified: {}"
+                        .format(protocols))
+
+    protocol = protocols[0]
+    url = properties[protocol].strip("'").strip('"')
+
+    return ExternalPackage(name=name,
+                           version=version,
+                           user=user,
+                           channel=channel,
+                           protocol=protocol,
+                           url=url,
+                           **properties)
 
 
 def generate_new_conanfile(args, orig_conanfile_path, new_conanfile):
@@ -692,50 +1088,8 @@ def generate_new_conanfile(args, orig_conanfile_path, new_conanfile):
                     if '}' not in line:
                         continue
 
-                    external_package_match = detect_external_package_re.match(external_package_lines[0])
-
-                    external_package_str = "".join(external_package_lines)
-                    start_props = external_package_str.find('{') + 1
-                    end_props = external_package_str.find('}', start_props)
-                    external_package_props_str = external_package_str[start_props:end_props]
-                    props_str = external_package_props_str.split(',')
-                    properties = {}
-                    for prop in props_str:
-                        external_package_property_match = external_package_property_re.match(prop)
-                        if not external_package_property_match:
-                            continue
-                        properties[external_package_property_match.group('property')] = external_package_property_match.group('value')
-
+                    package_info = parse_external_package("".join(external_package_lines))
                     external_package_lines = []
-                    name = external_package_match.group('package')
-                    version = external_package_match.group('version')
-                    if not name or not version:
-                        raise Exception("name and version of package is required !!"
-                                        "Please, specify it in following format: package/version")
-                    user = external_package_match.group('user')
-                    channel = external_package_match.group('channel')
-                    protocols = []
-                    for prot in ["git", "zip", "conan", "remote", "path"]:
-                        if prot in properties:
-                            protocols.append(prot)
-
-                    if len(protocols) == 0:
-                        raise Exception("No protocols where found. Protocol should be specified from the following list: {}"
-                                        .format(protocols))
-                    if len(protocols) > 1:
-                        raise Exception("From the following list, only single protocol should be specified: {}"
-                                        .format(protocols))
-
-                    protocol = protocols[0]
-                    url = properties[protocol].strip("'").strip('"')
-
-                    package_info = ExternalPackage(name=name,
-                                                   version=version,
-                                                   user=user,
-                                                   channel=channel,
-                                                   protocol=protocol,
-                                                   url=url,
-                                                   **properties)
                     requires.append(package_info)
                     full_package_name = package_info.full_package_name
                     if full_package_name[-1] == '@':
@@ -765,55 +1119,799 @@ def generate_new_conanfile(args, orig_conanfile_path, new_conanfile):
         return requires
 
 
-def regenerate_conanfile(args, command):
+def regenerate_conanfile(args, command_args):
+    """ command_args are arguments of conan command starting from command name, e.g. ['info', 'path', ...] """
     if '@' in args.path_or_reference:
-        command_index = sys.argv.index(command)
-        command_arg = copy.copy(sys.argv)[command_index:]
-        conan_command = [sys.executable, "-m", "conans.conan", *command_arg]
+        conan_command = [sys.executable, "-m", "conans.conan", *command_args]
         run_command(conan_command)
     else:
         with tempfile.TemporaryDirectory() as tmpdirname:
             orig_conanfile_path = args.path_or_reference
             new_conanfile_path = os.path.join(tmpdirname, "conanfile.txt")
             generate_new_conanfile(args, orig_conanfile_path, new_conanfile_path)
-            command_index = sys.argv.index(command)
-            command_arg = copy.copy(sys.argv)[command_index:]
+            command_arg = list(command_args)
             path_or_reference_index = command_arg.index(args.path_or_reference)
             command_arg[path_or_reference_index] = tmpdirname
             conan_command = [sys.executable, "-m", "conans.conan", *command_arg]
             run_command(conan_command)
 
 
-def install_external_packages(args, requires: List[ExternalPackage]):
-    orig_conanfile_path = args.path_or_reference
+def validate_external_package(package: ExternalPackage):
+    if package.protocol not in ['zip', 'conan'] and package.package_hash_algo:
+        raise Exception("hash[{}] allowed only for zip and conan protocols"
+                        .format(package.package_hash_algo))
+    if package.protocol not in ['git', 'zip'] and package.package_subdir:
+        raise Exception("subdir[{}] allowed only for git and zip protocols"
+                        .format(package.package_subdir))
+
+
+def configure_network_limits(args):
+    network_limits.configure(args.fetch_jobs or fetch_jobs, args.fetch_jobs_per_host or fetch_jobs_per_host)
+
+
+def fetch_external_package(package: ExternalPackage, conanfile_path, bundle: Bundle = None, offline=False):
+    if bundle is not None and package.protocol in ['git', 'zip', 'conan']:
+        with cpu_slots:
+            source_dir = bundle.fetch(package, source_cache)
+        if package.protocol == 'zip':
+            return find_package_source_dir(source_dir)
+        return source_dir
+    elif offline and package.protocol in ['git', 'zip', 'conan']:
+        source_dir = resolved_sources.lookup(package_spec(package), source_cache)
+        if source_dir is None:
+            raise Exception("{} sources were not fetched, run 'conanex fetch' before offline install"
+                            .format(package.full_package_name))
+        write_output("{} sources were found in cache".format(package.full_package_name))
+        package.stats['source_cache_hit'] = True
+        if package.protocol == 'zip':
+            return find_package_source_dir(source_dir)
+        return source_dir
+    elif package.protocol in ['git', 'zip', 'conan']:
+        if package.protocol == 'git':
+            source_dir = fetch_package_from_git(package)
+        elif package.protocol == 'zip':
+            source_dir = fetch_package_from_zip(package)
+        else:
+            source_dir = fetch_package_from_conanfile(package)
+        # Tag or url without hash is resolved to the same sources on offline install
+        kind, key = source_cache.entry_of(source_dir)
+        resolved_sources.record(package_spec(package), kind, key)
+        return source_dir
+    elif package.protocol == 'path':
+        path = resolve_package_path(package, conanfile_path)
+        with cpu_slots, package.measure('hash_time'):
+            package.source_digest = fingerprint_index.scan(path)
+        return path
+    return None
+
+
+def build_external_package(args, package: ExternalPackage, source_dir):
+    try:
+        if package.protocol in ['git', 'zip', 'conan']:
+            install_package_from_sources(args, package, source_dir)
+        elif package.protocol == 'path':
+            install_package_from_path(args, package, source_dir)
+        elif package.protocol == 'remote':
+            install_package_from_remote(args, package)
+    except:
+        run_conan_remove_command(package.full_package_name)
+        raise
+
+
+def is_package_changed(package: ExternalPackage):
+    built_digest = fingerprint_index.built_digest(package.full_package_name)
+    return built_digest is None or built_digest != package.source_digest
+
+
+def prefetch_external_package(package: ExternalPackage, conanfile_path, bundle: Bundle = None, offline=False):
+    in_cache = is_package_in_cache(package)
+    if in_cache and package.protocol != 'path':
+        write_output("{} was found in cache".format(package.full_package_name))
+        package.stats['cache_hit'] = True
+        return True, None
+    if offline and package.protocol == 'remote':
+        raise Exception("{} was not found in cache, run 'conanex fetch' before offline install"
+                        .format(package.full_package_name))
+
+    source_dir = fetch_external_package(package, conanfile_path, bundle, offline)
+    if in_cache:
+        # Local sources could be changed without changing of version, so they are rebuilt on any change
+        if not is_package_changed(package):
+            write_output("{} was found in cache, its sources were not changed".format(package.full_package_name))
+            package.stats['cache_hit'] = True
+            return True, None
+        write_output("{} sources were changed since last build".format(package.full_package_name))
+    return False, source_dir
+
+
+def describe_profile(args):
+    profile = []
+    for name, prefix in [('profile', 'pr'), ('profile:host', 'pr:h'), ('profile:all', 'pr:a'),
+                         ('settings', 's'), ('settings:host', 's:h'), ('settings:all', 's:a')]:
+        for value in get_arg_values(args, name):
+            profile.append("{}={}".format(prefix, value))
+    return ' '.join(profile) if profile else 'default'
+
+
+def record_history(method, *args):
+    # History is only informational, so broken database should not break install
+    try:
+        return method(*args)
+    except sqlite3.Error as e:
+        write_output("conanex history is not available: {}".format(e))
+        return None
+
+
+def build_matrix_args(args):
+    profiles = get_arg_values(args, 'matrix_profile') or [None]
+    settings_sets = get_arg_values(args, 'matrix_settings') or [None]
+    if profiles == [None] and settings_sets == [None]:
+        return [args]
+
+    matrix = []
+    for profile in profiles:
+        for settings in settings_sets:
+            entry_args = copy.copy(args)
+            entry_name = []
+            if profile:
+                entry_args.profile = False
+                setattr(entry_args, 'profile:host', profile)
+                entry_name.append(Path(profile).name)
+            if settings:
+                entry_settings = [setting.strip() for setting in settings.split(',') if setting.strip()]
+                entry_args.settings = get_arg_values(args, 'settings') + entry_settings
+                entry_name.extend(entry_settings)
+            if args.output_folder:
+                entry_name = re.sub(r'[^\w.=-]+', '_', '-'.join(entry_name)).replace('=', '-')
+                entry_args.output_folder = args.output_folder.replace('{matrix}', entry_name)
+            matrix.append(entry_args)
+    return matrix
+
+
+BUILD_JOBS_CONF = 'tools.build:jobs'
+
+
+def get_cpu_budget(args):
+    for name in ['conf', 'conf:host', 'conf:all']:
+        for value in get_arg_values(args, name):
+            conf_name, _, conf_value = value.partition('=')
+            if conf_name.strip() == BUILD_JOBS_CONF:
+                return int(conf_value)
+    return os.cpu_count() or 1
+
+
+def with_build_jobs(args, cpu_jobs):
+    build_args = copy.copy(args)
+    for name in ['conf', 'conf:build', 'conf:host', 'conf:all']:
+        values = [value for value in get_arg_values(args, name)
+                  if value.partition('=')[0].strip() != BUILD_JOBS_CONF]
+        if name in ['conf', 'conf:build']:
+            values.append("{}={}".format(BUILD_JOBS_CONF, cpu_jobs))
+        setattr(build_args, name, values)
+    return build_args
+
+
+requirement_declaration = r"\b(?:requires|tool_requires|build_requires|test_requires)\s*[(=]\s*(?P<value>.*)"
+requirement_declaration_re = re.compile(requirement_declaration)
+formatted_string_re = re.compile(r"\b[fF][rR]?['\"]")
+
+
+def has_computed_requirements(recipe_dir, recipe):
+    """ True if some requirements of recipe are not string literals, so they could not be matched to packages """
+    for match in requirement_declaration_re.finditer(recipe):
+        value = match.group('value').strip()
+        if not value or value[0] not in ['"', "'", '[', '('] or formatted_string_re.search(value):
+            return True
+    try:
+        with open(os.path.join(recipe_dir, "conandata.yml")) as f:
+            return 'requires' in f.read()
+    except OSError:
+        return False
+
+
+def get_external_dependencies(package: ExternalPackage, source_dir, packages: List[ExternalPackage]):
+    """
+    External packages which references (exact version or version range) are mentioned in recipe of package,
+    None if they could not be detected
+    """
+    if package.protocol == 'remote':
+        # Recipe of remote package is not inspected, it could require any of external packages
+        return None
+    recipe_dir = source_dir if package.protocol == 'path' else get_package_recipe_dir(source_dir, package)
+    try:
+        with open(os.path.join(recipe_dir, "conanfile.py")) as f:
+            recipe = f.read()
+    except OSError:
+        return None
+    if has_computed_requirements(recipe_dir, recipe):
+        return None
+    return [dependency for dependency in packages
+            if dependency.version and re.search(r"['\"]{}/({}|\[[^\]]*\])[@#'\"]".format(
+                re.escape(dependency.name), re.escape(dependency.version)), recipe)]
+
+
+def get_install_folder(args):
+    """ Output folder or folder of conanfile (root of workspace), install journal is kept there """
+    if args.journal_folder:
+        return args.journal_folder
+    if args.output_folder and '{' not in args.output_folder:
+        return os.path.abspath(args.output_folder)
+    if os.path.isdir(args.path_or_reference):
+        return args.path_or_reference
+    return os.path.dirname(args.path_or_reference)
+
+
+def record_journal(method, *args):
+    # Journal only saves work of failed install, so install should not fail if it could not be written
+    try:
+        return method(*args)
+    except OSError as e:
+        write_output("conanex install journal is not available: {}".format(e))
+        return None
+
+
+def describe_failures(scheduler, matrix, requires):
+    lines = []
+    for (index, package_index), error in sorted(scheduler.failures.items()):
+        lines.append("  {} [{}]: {}".format(requires[package_index].full_package_name,
+                                            describe_profile(matrix[index]), str(error).replace('\n', '\n    ')))
+    for index, package_index in sorted(scheduler.skipped):
+        lines.append("  {} [{}]: skipped, it depends on failed package".format(
+            requires[package_index].full_package_name, describe_profile(matrix[index])))
+    return '\n'.join(lines)
+
+
+def install_external_packages(args, requires: List[ExternalPackage], jobs=1, matrix=None, bundle: Bundle = None):
+    conanfile_path = os.path.dirname(args.path_or_reference)
+    matrix = matrix or [args]
+    requires = [package for package in requires
+                if package.protocol in ['git', 'zip', 'path', 'conan', 'remote']]
     for package in requires:
-        if package.protocol in ['git', 'zip', 'path', 'conan', 'remote']:
-            if is_package_in_cache(package):
-                print("{} was found in cache".format(package.full_package_name))
-                continue
-            if package.protocol not in ['zip', 'conan'] and package.package_hash_algo:
-                raise Exception("hash[{}] allowed only for zip and conan protocols"
-                                .format(package.package_hash_algo))
+        validate_external_package(package)
+    if len(requires) == 0:
+        return []
+    if args.compiler_cache:
+        find_compiler_cache(args.compiler_cache)
+
+    run_id = record_history(run_history.start_run, 'install', args.path_or_reference)
+    exit_status = 1
+    # The same recipe should not be exported concurrently by conan create for different profiles
+    package_locks = {package.full_package_name: threading.Lock() for package in requires}
+    create_times = record_history(run_history.last_create_times) or {}
+    workers = max(jobs, 1) * len(matrix)
+    keep_going = bool(args.keep_going)
+    journal = InstallJournal(get_install_folder(args))
+    # Package with its statistics for every profile, including packages that were found in cache
+    results = {}
+
+    # Cache checks and downloads of all packages are done concurrently and only once for all profiles,
+    # builds are started as soon as sources of package and its dependencies are ready
+    configure_network_limits(args)
+    with ContextThreadPoolExecutor(max_workers=min(len(requires), fetch_threads)) as fetch_executor:
+        def build(key, entry_args, package, prefetch_future, first_entry, cpu_jobs):
+            in_cache, source_dir = prefetch_future.result()
+            # Fetch statistics are attributed only to the first profile that used the sources
+            entry_package = copy.copy(package)
+            entry_package.stats = dict(package.stats) if first_entry else {'cache_hit': in_cache}
             try:
-                if package.protocol == 'git':
-                    install_package_from_git(args, package)
-                elif package.protocol == 'zip':
-                    install_package_from_zip(args, package)
-                elif package.protocol == 'path':
-                    conanfile_path = os.path.dirname(orig_conanfile_path)
-                    conanfile_posix_path = Path(conanfile_path).as_posix()
-                    if not Path(package.url).is_absolute():
-                        path = str(Path("{}/{}".format(conanfile_posix_path, package.url)))
-                    else:
-                        path = package.url
-                    install_package_from_path(args, package, path)
-                elif package.protocol == 'conan':
-                    install_package_from_conanfile(args, package)
-                elif package.protocol == 'remote':
-                    install_package_from_remote(args, package)
-            except:
-                run_conan_remove_command(package.full_package_name)
+                if not in_cache:
+                    with package_locks[package.full_package_name]:
+                        # Single build at a time keeps tools.build:jobs from profile
+                        build_args = with_build_jobs(entry_args, cpu_jobs) if workers > 1 else entry_args
+                        build_external_package(build_args, entry_package, source_dir)
+                    if package.source_digest is not None:
+                        fingerprint_index.record_built(package.full_package_name, package.source_digest)
+                record_journal(journal.record, package_spec(package), describe_profile(entry_args), 'installed')
+            except Exception as e:
+                record_journal(journal.record, package_spec(package), describe_profile(entry_args), 'failed', e)
                 raise
+            finally:
+                results[key] = (describe_profile(entry_args), entry_package)
+                if run_id is not None:
+                    record_history(run_history.record_package, run_id, entry_package.full_package_name,
+                                   entry_package.protocol, describe_profile(entry_args), entry_package.stats)
+
+        def inspect(index, package_index, prefetch_result):
+            in_cache, source_dir = prefetch_result
+            if in_cache:
+                return None
+            dependencies = get_external_dependencies(requires[package_index], source_dir, requires[:package_index])
+            if dependencies is None:
+                # Without known dependencies package waits for all packages listed before it
+                return [(index, dependency_index) for dependency_index in range(package_index)]
+            return [(index, requires.index(dependency)) for dependency in dependencies]
+
+        def prefetch(package):
+            # Local sources could be changed after failed install, so only they are checked again
+            if package.protocol != 'path' and \
+                    all(journal.is_installed(package_spec(package), describe_profile(entry_args))
+                        for entry_args in matrix):
+                write_output("{} was installed by previous unfinished install".format(package.full_package_name))
+                package.stats['cache_hit'] = True
+                return True, None
+            return prefetch_external_package(package, conanfile_path, bundle, args.offline)
+
+        prefetch_futures = [fetch_executor.submit(prefetch, package) for package in requires]
+        # Each profile has its own workers, builds of all profiles share CPU budget
+        scheduler = BuildScheduler(workers, get_cpu_budget(args), keep_going)
+        for index, entry_args in enumerate(matrix):
+            profile = describe_profile(entry_args)
+            for package_index, (package, prefetch_future) in enumerate(zip(requires, prefetch_futures)):
+                scheduler.add((index, package_index),
+                              partial(build, (index, package_index), entry_args, package, prefetch_future,
+                                      index == 0),
+                              create_times.get((package.full_package_name, profile)),
+                              prefetch_future,
+                              partial(inspect, index, package_index),
+                              # Packages of a profile are built one by one in order of requires,
+                              # with keep going only packages that depend on failed one are skipped
+                              [(index, package_index - 1)] if jobs <= 1 and package_index > 0 else [])
+        try:
+            scheduler.run()
+            if scheduler.failures:
+                raise Exception("{} of {} external package builds failed, rerun install to retry them:\n{}"
+                                .format(len(scheduler.failures), len(scheduler.tasks),
+                                        describe_failures(scheduler, matrix, requires)))
+            exit_status = 0
+        finally:
+            if run_id is not None:
+                record_history(run_history.finish_run, run_id, exit_status)
+    record_journal(journal.remove)
+    return [results[key] for key in sorted(results)]
+
+
+def resolve_conanfile_path(path_or_reference):
+    if os.path.isdir(path_or_reference):
+        return os.path.join(os.path.abspath(path_or_reference), "conanfile.txt")
+    elif os.path.isfile(path_or_reference):
+        return path_or_reference
+    raise Exception("path_or_reference should be either directory or file")
+
+
+def find_workspace_conanfiles(workspace):
+    if os.path.isdir(workspace):
+        paths = glob.glob(os.path.join(workspace, '**', 'conanfile.txt'), recursive=True)
+    else:
+        paths = []
+        for path in glob.glob(workspace, recursive=True):
+            if os.path.isdir(path):
+                path = os.path.join(path, "conanfile.txt")
+            if os.path.isfile(path):
+                paths.append(path)
+    if len(paths) == 0:
+        raise Exception("No conanfile.txt was found in workspace {}".format(workspace))
+    return sorted(set(os.path.abspath(path) for path in paths))
+
+
+def merge_workspace_requires(components):
+    """ Every external package is installed once for all components, its definitions should be the same """
+    requires = {}
+    definitions = {}
+    for conanfile_path, component_requires in components:
+        for package in component_requires:
+            if package.protocol == 'path':
+                # Relative paths of different components point to the same folder only when resolved
+                package.url = os.path.abspath(resolve_package_path(package, os.path.dirname(conanfile_path)))
+                package.attrs['path'] = package.url
+            requires.setdefault(package.full_package_name, package)
+            definitions.setdefault(package.full_package_name, {}) \
+                .setdefault(package_spec(package), (package, []))[1].append(conanfile_path)
+
+    conflicts = []
+    for full_package_name, package_definitions in definitions.items():
+        if len(package_definitions) > 1:
+            conflicts.append("{} is defined differently in:\n{}".format(
+                full_package_name,
+                '\n'.join("    {}: {{ {} }}".format(', '.join(conanfile_paths),
+                                                   ', '.join("{} = {}".format(name, value)
+                                                             for name, value in package.attrs.items()))
+                          for package, conanfile_paths in package_definitions.values())))
+    if conflicts:
+        raise Exception("Conflicting definitions of external packages in workspace:\n{}".format('\n'.join(conflicts)))
+    return list(requires.values())
+
+
+def build_component_args(args, workspace_root, conanfile_path):
+    component_args = copy.copy(args)
+    component_dir = os.path.dirname(conanfile_path)
+    component = os.path.relpath(component_dir, workspace_root)
+    if not args.output_folder:
+        component_args.output_folder = component_dir
+    elif '{component}' in args.output_folder:
+        component_args.output_folder = args.output_folder.replace('{component}', component)
+    else:
+        component_args.output_folder = os.path.join(args.output_folder, component)
+    return component_args
+
+
+def run_conan_cache_save_command(package: ExternalPackage, cache_archive_path):
+    reference = package.full_package_name.rstrip('@')
+    conan_save_command = [sys.executable, "-m", "conans.conan", "cache", "save",
+                          "{}:*".format(reference), "--file", cache_archive_path]
+    run_command(conan_save_command)
+
+
+def run_conan_download_command(args, package: ExternalPackage):
+    reference = package.full_package_name.rstrip('@')
+    conan_download_command = [sys.executable, "-m", "conans.conan", "download", reference, "-r", package.url]
+    if args.only_recipe:
+        conan_download_command.append('--only-recipe')
+    if args.package_query:
+        conan_download_command.extend(['-p', args.package_query])
+    run_command(conan_download_command)
+
+
+def restore_bundle_packages(bundle: Bundle):
+    for package_name, cache_archive_path in bundle.conan_cache_archives():
+        write_output("Restoring {} from bundle".format(package_name))
+        run_command([sys.executable, "-m", "conans.conan", "cache", "restore", cache_archive_path])
+
+
+def create_bundle(args):
+    conanfile_path = resolve_conanfile_path(args.path_or_reference)
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        requires = generate_new_conanfile(args, conanfile_path, os.path.join(tmpdirname, "conanfile.txt"))
+    for package in requires:
+        validate_external_package(package)
+
+    source_packages = [package for package in requires if package.protocol in ['git', 'zip', 'conan']]
+    remote_packages = [package for package in requires if package.protocol == 'remote']
+    for package in requires:
+        if package.protocol == 'path':
+            write_output("{} is installed from local path and is not added to bundle".format(package.full_package_name))
+
+    configure_network_limits(args)
+    writer = BundleWriter(args.output)
+    try:
+        with ContextThreadPoolExecutor(max_workers=max(min(len(source_packages), fetch_threads), 1)) as fetch_executor:
+            fetch_futures = [fetch_executor.submit(fetch_external_package, package, os.path.dirname(conanfile_path))
+                             for package in source_packages]
+            for package, fetch_future in zip(source_packages, fetch_futures):
+                kind, key = source_cache.entry_of(fetch_future.result())
+                writer.add_sources(package, kind, key, source_cache.entry_path(kind, key))
+                write_output("{} sources were added to bundle".format(package.full_package_name))
+
+        for package in remote_packages:
+            run_conan_download_command(args, package)
+            with tempfile.TemporaryDirectory() as tmpdirname:
+                cache_archive_path = os.path.join(tmpdirname, "conan_cache.tgz")
+                run_conan_cache_save_command(package, cache_archive_path)
+                writer.add_conan_cache(package, cache_archive_path)
+            write_output("{} was added to bundle".format(package.full_package_name))
+    finally:
+        writer.close()
+    write_output("Bundle was written to {}".format(args.output))
+
+
+def read_external_requires(args):
+    """ Returns folder that relative paths of packages are resolved from and external packages of conanfile """
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        new_conanfile_path = os.path.join(tmpdirname, "conanfile.txt")
+        if args.workspace:
+            # Paths of packages are already resolved by merge
+            return os.path.abspath(args.workspace), \
+                merge_workspace_requires([(conanfile_path,
+                                           generate_new_conanfile(args, conanfile_path, new_conanfile_path))
+                                          for conanfile_path in find_workspace_conanfiles(args.workspace)])
+        elif args.path_or_reference:
+            conanfile_path = resolve_conanfile_path(args.path_or_reference)
+            return os.path.dirname(conanfile_path), generate_new_conanfile(args, conanfile_path, new_conanfile_path)
+        raise Exception("Either path_or_reference or --workspace should be specified")
+
+
+def fetch_sources(args):
+    _, requires = read_external_requires(args)
+    for package in requires:
+        validate_external_package(package)
+
+    source_packages = [package for package in requires if package.protocol in ['git', 'zip', 'conan']]
+    remote_packages = [package for package in requires if package.protocol == 'remote']
+    configure_network_limits(args)
+    with ContextThreadPoolExecutor(max_workers=max(min(len(source_packages), fetch_threads), 1)) as fetch_executor:
+        fetch_futures = [fetch_executor.submit(fetch_external_package, package, None)
+                         for package in source_packages]
+        for package, fetch_future in zip(source_packages, fetch_futures):
+            fetch_future.result()
+            write_output("{} sources were fetched".format(package.full_package_name))
+
+    # Concurrent conan commands could break conan cache, so remote packages are downloaded one by one
+    for package in remote_packages:
+        with package.measure('fetch_time'):
+            run_conan_download_command(args, package)
+        write_output("{} was downloaded".format(package.full_package_name))
+    return source_packages + remote_packages
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return '-'
+    return "{:.1f}s".format(seconds)
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return "{:.0f}{}".format(size, unit)
+        size /= 1024
+    return "{:.1f}GB".format(size)
+
+
+def format_hit_rate(hits, misses):
+    if not hits and not misses:
+        return '-'
+    return "{:.0%}".format(hits / (hits + misses))
+
+
+def get_content_length(url):
+    with network_limits.slot(url):
+        with urlopen(Request(url, method='HEAD')) as resp:
+            content_length = resp.headers.get('Content-Length')
+            return int(content_length) if content_length else None
+
+
+def plan_package_sources(args, package: ExternalPackage, conanfile_path):
+    """ What install would do to get sources of package, without downloading them """
+    if package.protocol == 'remote':
+        return {'action': 'conan install', 'remote': package.url}
+    if package.protocol == 'path':
+        path = resolve_package_path(package, conanfile_path)
+        digest = fingerprint_index.scan(path, update=False)
+        return {'action': 'local', 'changed': fingerprint_index.built_digest(package.full_package_name) != digest}
+    if args.from_bundle:
+        return {'action': 'bundle'}
+    if args.offline:
+        source_dir = resolved_sources.lookup(package_spec(package), source_cache)
+        return {'action': 'cached' if source_dir else 'missing'}
+    if package.protocol == 'git':
+        with network_limits.slot(package.url):
+            commit = resolve_git_commit(package.get_attr("tag"), package.url)
+        cache_key = git_cache_key(commit, package.package_subdir)
+        return {'action': 'cached' if source_cache.lookup('git', cache_key) else 'clone', 'commit': commit}
+
+    kind = 'zip' if package.protocol == 'zip' else 'conan'
+    if package.package_hash_algo == 'sha256' and source_cache.lookup(kind, package.package_hash_code):
+        return {'action': 'cached'}
+    if not uri_validator(package.url):
+        # Local file is hashed anyway by install, so it is known whether its sources are cached
+        with cpu_slots:
+            file_hash = calculate_file_hashes(package.url, ['sha256'])['sha256']
+        return {'action': 'cached' if source_cache.lookup(kind, file_hash) else 'local'}
+    if not package.package_hash_algo:
+        metadata = http_cache.lookup(package.url)
+        if metadata and source_cache.lookup(kind, metadata['sha256']):
+            return {'action': 'revalidate'}
+    return {'action': 'download', 'bytes': get_content_length(package.url)}
+
+
+def plan_external_package(args, package: ExternalPackage, conanfile_path):
+    in_cache = is_package_in_cache(package)
+    plan = {'reference': package.full_package_name.rstrip('@'), 'protocol': package.protocol,
+            'url': package.url, 'in_cache': in_cache}
+    if in_cache and package.protocol != 'path':
+        plan['sources'] = {'action': 'not needed'}
+        plan['build'] = False
+        return plan
+    try:
+        plan['sources'] = plan_package_sources(args, package, conanfile_path)
+    except (CommandException, URLError, OSError, ValueError) as e:
+        plan['sources'] = {'action': 'error', 'error': str(e)}
+    plan['build'] = not in_cache or plan['sources'].get('changed', True)
+    return plan
+
+
+def plan_install(args):
+    """ Cost annotated plan of install: which packages are cached, what is downloaded and built and how long """
+    conanfile_path, requires = read_external_requires(args)
+    requires = [package for package in requires
+                if package.protocol in ['git', 'zip', 'path', 'conan', 'remote']]
+    for package in requires:
+        validate_external_package(package)
+    matrix = build_matrix_args(args)
+    create_times = record_history(run_history.last_create_times) or {}
+
+    configure_network_limits(args)
+    with ContextThreadPoolExecutor(max_workers=max(min(len(requires), fetch_threads), 1)) as plan_executor:
+        packages = list(plan_executor.map(lambda package: plan_external_package(args, package, conanfile_path),
+                                          requires))
+
+    total = {'downloads': 0, 'download_bytes': 0, 'unknown_download_sizes': 0, 'clones': 0,
+             'builds': 0, 'estimated_build_time': 0.0, 'unknown_build_times': 0}
+    for package, package_plan in zip(requires, packages):
+        sources = package_plan['sources']
+        if sources['action'] == 'download':
+            total['downloads'] += 1
+            if sources['bytes'] is None:
+                total['unknown_download_sizes'] += 1
+            else:
+                total['download_bytes'] += sources['bytes']
+        elif sources['action'] == 'clone':
+            total['clones'] += 1
+
+        package_plan['builds'] = []
+        if not package_plan['build']:
+            continue
+        for entry_args in matrix:
+            profile = describe_profile(entry_args)
+            estimated_time = create_times.get((package.full_package_name, profile))
+            package_plan['builds'].append({'profile': profile, 'estimated_time': estimated_time})
+            total['builds'] += 1
+            if estimated_time is None:
+                total['unknown_build_times'] += 1
+            else:
+                total['estimated_build_time'] += estimated_time
+    return {'conanfile': args.workspace or args.path_or_reference, 'packages': packages, 'total': total}
+
+
+def describe_plan_sources(sources):
+    action = sources['action']
+    if action == 'download':
+        return "download {}".format(format_bytes(sources['bytes']) if sources['bytes'] is not None else "?")
+    if action == 'clone':
+        return "clone {}".format(sources['commit'][:12])
+    if action == 'local':
+        return "local, changed" if sources.get('changed') else "local"
+    if action == 'error':
+        return "error: {}".format(sources['error'])
+    return action
+
+
+def print_plan(plan, plan_format):
+    if plan_format == 'json':
+        print(json.dumps(plan, indent=2))
+        return
+    print("Install plan of {}:".format(plan['conanfile']))
+    for package_plan in plan['packages']:
+        if package_plan['builds']:
+            build = ', '.join("build ~{} [{}]".format(format_seconds(build['estimated_time']), build['profile'])
+                              for build in package_plan['builds'])
+        else:
+            build = "in cache"
+        print("  {:<30} {:<7} {:<24} {}".format(package_plan['reference'], package_plan['protocol'],
+                                                 describe_plan_sources(package_plan['sources']), build))
+    total = plan['total']
+    print("Total: {} downloads ({}{}), {} clones, {} builds (~{}{})".format(
+        total['downloads'], format_bytes(total['download_bytes']),
+        ", {} of unknown size".format(total['unknown_download_sizes']) if total['unknown_download_sizes'] else "",
+        total['clones'], total['builds'], format_seconds(total['estimated_build_time']),
+        ", {} without previous builds".format(total['unknown_build_times']) if total['unknown_build_times'] else ""))
+
+
+def show_stats(args):
+    summary = run_history.cache_summary()
+    if summary['total'] == 0:
+        print("No install runs were recorded yet")
+    else:
+        print("Conan cache hits: {} of {} ({:.0%}), source cache hits: {}, downloaded: {}"
+              .format(summary['cache_hits'], summary['total'], summary['cache_hits'] / summary['total'],
+                      summary['source_cache_hits'], format_bytes(summary['bytes_downloaded'])))
+
+    if args.package:
+        print("\nLast runs of {}:".format(args.package))
+        print("{:<20} {:>6} {:>6} {:>10} {:>8} {:>8} {:>8} {:>10} {:>5} {:>9}  {}".format(
+            'finished', 'cache', 'source', 'download', 'fetch', 'hash', 'extract', 'create', 'exit', 'compiler',
+            'profile'))
+        for row in run_history.package_trend(args.package, args.limit):
+            print("{:<20} {:>6} {:>6} {:>10} {:>8} {:>8} {:>8} {:>10} {:>5} {:>9}  {}".format(
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['finished'])),
+                'hit' if row['cache_hit'] else 'miss',
+                'hit' if row['source_cache_hit'] else 'miss',
+                format_bytes(row['bytes_downloaded']),
+                format_seconds(row['fetch_time']),
+                format_seconds(row['hash_time']),
+                format_seconds(row['extract_time']),
+                format_seconds(row['create_time']),
+                '-' if row['exit_status'] is None else row['exit_status'],
+                format_hit_rate(row['compiler_cache_hits'], row['compiler_cache_misses']),
+                row['profile']))
+    else:
+        print("\nSlowest packages:")
+        print("{:<40} {:>6} {:>10} {:>10} {:>10} {:>8}  {}".format(
+            'package', 'builds', 'average', 'max', 'last', 'failures', 'profile'))
+        for row in run_history.slowest_packages(args.limit):
+            print("{:<40} {:>6} {:>10} {:>10} {:>10} {:>8}  {}".format(
+                row['package'], row['builds'],
+                format_seconds(row['avg_create_time']),
+                format_seconds(row['max_create_time']),
+                format_seconds(row['last_create_time']),
+                row['failures'], row['profile']))
+
+        compiler_cache_rates = run_history.compiler_cache_rates(args.limit)
+        if compiler_cache_rates:
+            print("\nCompiler cache hit rates:")
+            print("{:<40} {:>6} {:>8} {:>8} {:>9} {:>9}  {}".format(
+                'package', 'builds', 'hits', 'misses', 'rate', 'last', 'profile'))
+            for row in compiler_cache_rates:
+                print("{:<40} {:>6} {:>8} {:>8} {:>9} {:>9}  {}".format(
+                    row['package'], row['builds'], row['hits'], row['misses'],
+                    format_hit_rate(row['hits'], row['misses']),
+                    format_hit_rate(row['last_hits'], row['last_misses']), row['profile']))
+
+    if args.openmetrics:
+        run_history.write_openmetrics(args.openmetrics)
+        print("\nOpenMetrics were written to {}".format(args.openmetrics))
+
+
+def open_install_bundle(args):
+    if not args.from_bundle:
+        return None
+    bundle = Bundle(args.from_bundle)
+    restore_bundle_packages(bundle)
+    return bundle
+
+
+def run_conan_install_group(install_args):
+    for entry_args, conanfile_path in install_args:
+        run_conan_install_command(entry_args, conanfile_path)
+
+
+def run_conan_install_commands(install_args):
+    # Installs into the same folder would rewrite generated presets, toolchain and env scripts concurrently,
+    # so they are run one after another
+    groups = {}
+    for entry_args, conanfile_path in install_args:
+        output_folder = os.path.abspath(entry_args.output_folder) if entry_args.output_folder \
+            else os.path.dirname(os.path.abspath(conanfile_path))
+        groups.setdefault(output_folder, []).append((entry_args, conanfile_path))
+    with ContextThreadPoolExecutor(max_workers=max(len(groups), 1)) as install_executor:
+        install_futures = [install_executor.submit(run_conan_install_group, group) for group in groups.values()]
+        for install_future in install_futures:
+            install_future.result()
+
+
+def install_conanfile(args):
+    """ Returns (profile, package) for every external package and (conanfile, args) of every conan install """
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        new_conanfile_path = os.path.join(tmpdirname, "conanfile.txt")
+        args.path_or_reference = resolve_conanfile_path(args.path_or_reference)
+        if not args.output_folder:
+            # conan install runs on generated conanfile in temporary folder, its output should not be removed with it
+            args.output_folder = os.path.dirname(os.path.abspath(args.path_or_reference))
+        requires = generate_new_conanfile(args, args.path_or_reference, new_conanfile_path)
+        matrix = build_matrix_args(args)
+        bundle = open_install_bundle(args)
+        try:
+            package_results = install_external_packages(args, requires, args.external_jobs, matrix, bundle)
+        finally:
+            if bundle is not None:
+                bundle.close()
+        with open(new_conanfile_path, 'r') as f:
+            for line in f.readlines():
+                write_output(f"{line}\n")
+        run_conan_install_commands([(entry_args, new_conanfile_path) for entry_args in matrix])
+        return package_results, [(args.path_or_reference, entry_args) for entry_args in matrix]
+
+
+def install_workspace(args):
+    conanfile_paths = find_workspace_conanfiles(args.workspace)
+    workspace_root = os.path.abspath(args.workspace) if os.path.isdir(args.workspace) \
+        else os.path.commonpath([os.path.dirname(path) for path in conanfile_paths])
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        components = []
+        for index, conanfile_path in enumerate(conanfile_paths):
+            new_conanfile_path = os.path.join(tmpdirname, str(index), "conanfile.txt")
+            os.makedirs(os.path.dirname(new_conanfile_path))
+            requires = generate_new_conanfile(args, conanfile_path, new_conanfile_path)
+            components.append((conanfile_path, new_conanfile_path, requires))
+        requires = merge_workspace_requires([(conanfile_path, requires)
+                                             for conanfile_path, _, requires in components])
+        write_output("Workspace {} has {} components with {} external packages"
+                     .format(args.workspace, len(components), len(requires)))
+
+        args.path_or_reference = workspace_root
+        matrix = build_matrix_args(args)
+        bundle = open_install_bundle(args)
+        try:
+            package_results = install_external_packages(args, requires, args.external_jobs, matrix, bundle)
+        finally:
+            if bundle is not None:
+                bundle.close()
+        install_args = [(conanfile_path, new_conanfile_path,
+                         build_component_args(entry_args, workspace_root, conanfile_path))
+                        for conanfile_path, new_conanfile_path, _ in components
+                        for entry_args in matrix]
+        run_conan_install_commands([(entry_args, new_conanfile_path)
+                                    for _, new_conanfile_path, entry_args in install_args])
+        return package_results, [(conanfile_path, entry_args) for conanfile_path, _, entry_args in install_args]
 
 
 def run():
@@ -824,24 +1922,27 @@ def run():
 
     if 'info' in sys.argv:
         args = parse_info_args()
-        regenerate_conanfile(args, 'info')
+        regenerate_conanfile(args, sys.argv[sys.argv.index('info'):])
+    elif 'stats' in sys.argv:
+        args = parse_stats_args()
+        show_stats(args)
+    elif 'bundle' in sys.argv:
+        args = parse_bundle_args()
+        create_bundle(ConanArgs(args))
+    elif 'fetch' in sys.argv:
+        args = parse_fetch_args()
+        fetch_sources(ConanArgs(args))
     elif 'install' in sys.argv:
         args = parse_install_args()
         args = ConanArgs(args)
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            new_conanfile_path = os.path.join(tmpdirname, "conanfile.txt")
-            if os.path.isdir(args.path_or_reference):
-                args.path_or_reference = os.path.join(os.path.abspath(args.path_or_reference), "conanfile.txt")
-            elif os.path.isfile(args.path_or_reference):
-                args.path_or_reference = args.path_or_reference
-            else:
-                raise Exception("path_or_reference should be either directory or file")
-            requires = generate_new_conanfile(args, args.path_or_reference, new_conanfile_path)
-            install_external_packages(args, requires)
-            with open(new_conanfile_path, 'r') as f:
-                for line in f.readlines():
-                    print(f"{line}\n")
-            run_conan_install_command(args, new_conanfile_path)
+        if args.plan:
+            print_plan(plan_install(args), args.plan_format)
+        elif args.workspace:
+            install_workspace(args)
+        elif args.path_or_reference:
+            install_conanfile(args)
+        else:
+            raise Exception("Either path_or_reference or --workspace should be specified")
 
 
 if __name__ == '__main__':
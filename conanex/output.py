@@ -0,0 +1,36 @@
+import contextvars
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Callable that gets messages of conanex and output of conan commands instead of stdout, None to print them
+output_handler = contextvars.ContextVar('output_handler', default=None)
+
+
+def write_output(message):
+    handler = output_handler.get()
+    if handler is None:
+        print(message)
+    else:
+        handler(message)
+
+
+def is_redirected():
+    return output_handler.get() is not None
+
+
+@contextmanager
+def redirect_output(handler):
+    """ Messages of this thread and of threads started by it are passed to handler, lambda message: None is quiet """
+    token = output_handler.set(handler)
+    try:
+        yield
+    finally:
+        output_handler.reset(token)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ Tasks are run with output handler of thread that has submitted them """
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -0,0 +1,31 @@
+import hashlib
+import os
+
+from conanex.cache import conanex_home
+from conanex.fingerprint import read_json, write_json_atomically
+
+
+class ResolvedSources:
+    """
+    Source cache entry that every package definition was last resolved to: commit of git tag,
+    digest of archive or recipe downloaded without declared hash.
+    It allows to install packages offline after their sources were fetched.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(conanex_home(), "resolved")
+
+    def resolved_path(self, spec):
+        return os.path.join(self.root, hashlib.sha1(spec.encode()).hexdigest() + ".json")
+
+    def lookup(self, spec, source_cache):
+        resolved = read_json(self.resolved_path(spec), None)
+        if not resolved or resolved.get('spec') != spec:
+            return None
+        return source_cache.lookup(resolved['kind'], resolved['key'])
+
+    def record(self, spec, kind, key):
+        write_json_atomically(self.resolved_path(spec), {'spec': spec, 'kind': kind, 'key': key})
+
+
+resolved_sources = ResolvedSources()
@@ -0,0 +1,207 @@
+import os
+import re
+import threading
+
+from concurrent.futures import wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from conanex.output import ContextThreadPoolExecutor
+
+
+class BuildTask:
+    def __init__(self, key, build, duration, prefetch_future, inspect, after):
+        self.key = key
+        self.build = build
+        self.duration = duration
+        self.prefetch_future = prefetch_future
+        self.inspect = inspect
+        self.after = after
+        # Dependencies are known only when sources of package are fetched
+        self.dependencies = None
+        self.needs_build = True
+
+
+class BuildScheduler:
+    """
+    Runs builds on a limited number of workers. Among builds whose dependencies are already built
+    the one with the longest remaining critical path (its own duration plus the longest chain of builds
+    that depend on it) is started first. CPU budget is split between builds that run concurrently.
+    With keep_going failed build does not stop other builds, only builds that depend on it are skipped.
+    Build is also started only after builds listed in its after are over, whether they succeeded or not.
+    """
+
+    def __init__(self, workers, cpu_budget, keep_going=False):
+        self.workers = max(workers, 1)
+        self.cpu_budget = max(cpu_budget, 1)
+        self.keep_going = keep_going
+        self.tasks = {}
+        # Errors of failed builds and keys of builds that were skipped, filled only with keep_going
+        self.failures = {}
+        self.skipped = set()
+
+    def add(self, key, build, duration, prefetch_future, inspect, after=()):
+        """
+        build(cpu_jobs) runs the build, duration is a recorded duration of previous build or None,
+        inspect(prefetch_result) returns keys of builds that should be finished first
+        or None if there is nothing to build, after are keys of builds that only should be over first
+        """
+        self.tasks[key] = BuildTask(key, build, duration, prefetch_future, inspect, list(after))
+
+    def estimated_duration(self, task):
+        if not task.needs_build:
+            return 0
+        if task.duration is not None:
+            return task.duration
+        known_durations = [t.duration for t in self.tasks.values() if t.duration is not None]
+        return sum(known_durations) / len(known_durations) if known_durations else 1
+
+    def critical_paths(self):
+        dependents = {key: [] for key in self.tasks}
+        for task in self.tasks.values():
+            for dependency in task.dependencies or []:
+                dependents[dependency].append(task.key)
+
+        paths = {}
+
+        def critical_path(key):
+            if key not in paths:
+                paths[key] = self.estimated_duration(self.tasks[key]) + \
+                             max((critical_path(dependent) for dependent in dependents[key]), default=0)
+            return paths[key]
+
+        for key in self.tasks:
+            critical_path(key)
+        return paths
+
+    def inspect_fetched(self, pending):
+        for task in list(pending.values()):
+            if task.dependencies is None and task.prefetch_future.done():
+                try:
+                    dependencies = task.inspect(task.prefetch_future.result())
+                except Exception as e:
+                    if not self.keep_going:
+                        raise
+                    self.failures[task.key] = e
+                    del pending[task.key]
+                    continue
+                task.needs_build = dependencies is not None
+                task.dependencies = [key for key in dependencies or [] if key in self.tasks]
+
+    def skip_dependents(self, pending):
+        skipping = True
+        while skipping:
+            skipping = False
+            for task in list(pending.values()):
+                if any(key in self.failures or key in self.skipped for key in task.dependencies or []):
+                    self.skipped.add(task.key)
+                    del pending[task.key]
+                    skipping = True
+
+    def run(self):
+        pending = dict(self.tasks)
+        running = {}
+        finished = set()
+        error = None
+        with ContextThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                if error is None:
+                    try:
+                        self.inspect_fetched(pending)
+                    except BaseException as e:
+                        error = e
+                    self.skip_dependents(pending)
+
+                if error is None:
+                    paths = self.critical_paths()
+                    running_keys = {task.key for task, _ in running.values()}
+                    ready = [task for task in pending.values()
+                             if task.dependencies is not None and all(key in finished for key in task.dependencies)
+                             and not any(key in pending or key in running_keys for key in task.after)]
+                    # Packages that are not built are only recorded, so they do not hold workers for long
+                    ready.sort(key=lambda task: (not task.needs_build, paths[task.key]), reverse=True)
+                    for task in ready[:self.workers - len(running)]:
+                        cpu_jobs = 0
+                        if task.needs_build:
+                            used_cpu_jobs = sum(jobs for _, jobs in running.values())
+                            # Remaining budget is shared with builds that are expected to start alongside
+                            expected_builds = min(self.workers - len(running),
+                                                  len([t for t in pending.values() if t.needs_build]))
+                            cpu_jobs = max(1, (self.cpu_budget - used_cpu_jobs) // max(expected_builds, 1))
+                        del pending[task.key]
+                        running[executor.submit(task.build, cpu_jobs)] = (task, cpu_jobs)
+
+                fetching = [task.prefetch_future for task in pending.values() if task.dependencies is None]
+                if not running:
+                    if error is not None:
+                        raise error
+                    if not pending:
+                        return
+                    if not fetching:
+                        raise Exception("Builds of {} depend on each other".format(', '.join(map(str, pending))))
+
+                done, _ = wait(list(running) + (fetching if error is None else []), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in running:
+                        task, _ = running.pop(future)
+                        try:
+                            future.result()
+                            finished.add(task.key)
+                        except BaseException as e:
+                            if self.keep_going and isinstance(e, Exception):
+                                self.failures[task.key] = e
+                            elif error is None:
+                                error = e
+
+
+def url_host(url):
+    """ Host of url or of scp-like git url (git@github.com:org/repo.git), None for local paths """
+    parsed = urlparse(url)
+    if parsed.scheme in ['', 'file']:
+        match = re.match(r'^[\w.-]+@([\w.-]+):', url)
+        return match.group(1) if match else None
+    return parsed.hostname
+
+
+class NetworkLimits:
+    """
+    Limits number of concurrent downloads, clones and ls-remotes in total and per host.
+    Only network part of fetch holds a slot, so verification and extraction of one package
+    do not delay download of the next one, and one slow server does not take all slots.
+    """
+
+    def __init__(self, total, per_host):
+        self.lock = threading.Lock()
+        self.limits = None
+        self.configure(total, per_host)
+
+    def configure(self, total, per_host):
+        with self.lock:
+            if self.limits == (total, per_host):
+                return
+            self.limits = (total, per_host)
+            self.total = threading.BoundedSemaphore(max(total, 1))
+            self.hosts = {}
+
+    def host_semaphore(self, host):
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = threading.BoundedSemaphore(max(self.limits[1], 1))
+            return self.hosts[host], self.total
+
+    @contextmanager
+    def slot(self, url):
+        host = url_host(url)
+        if host is None:
+            yield
+            return
+        host_semaphore, total_semaphore = self.host_semaphore(host)
+        # Slot of host is taken first, so waiting for busy host does not hold a slot of other hosts
+        with host_semaphore, total_semaphore:
+            yield
+
+
+network_limits = NetworkLimits(8, 4)
+# Conan cache checks, verification and extraction of sources use CPU, so only this number of them run at once,
+# while fetch threads are many because they mostly wait for network slots
+cpu_slots = threading.BoundedSemaphore(os.cpu_count() or 1)
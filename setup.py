@@ -101,6 +101,11 @@ setup(
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=project_requirements,
 
+    # Optional dependencies, for example: pip install conanex[zstd]
+    extras_require={
+        'zstd': ['zstandard'],
+    },
+
     # If there are data files included in your packages that need to be
     # installed, specify them here.  If using Python 2.6 or less, then these
     # have to be included in MANIFEST.in as well.
@@ -0,0 +1,129 @@
+import io
+import os
+import threading
+import time
+import zipfile
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from conanex import main
+from conanex.cache import SourceCache
+from conanex.history import RunHistory
+from conanex.http_cache import HttpMetadataCache, PartialDownloads
+
+
+@pytest.fixture
+def conanex_home(tmp_path, monkeypatch):
+    home = tmp_path / "conanex"
+    monkeypatch.setenv("CONANEX_HOME", str(home))
+    monkeypatch.setattr(main, 'source_cache', SourceCache(str(home / "sources")))
+    monkeypatch.setattr(main, 'http_cache', HttpMetadataCache(str(home / "http")))
+    monkeypatch.setattr(main, 'partial_downloads', PartialDownloads(str(home / "downloads")))
+    return home
+
+
+def make_recipe_zip(name, payload_size=0):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr("{}/conanfile.py".format(name), "from conan import ConanFile\n")
+        archive.writestr("{}/payload.bin".format(name), os.urandom(payload_size))
+    return buffer.getvalue()
+
+
+class ArchiveServer:
+    """ Serves one archive with ETag and Last-Modified, supports conditional and Range requests """
+
+    def __init__(self, content):
+        self.content = content
+        self.etag = '"v1"'
+        self.last_modified = 'Mon, 19 Oct 2026 00:00:00 GMT'
+        self.requests = []
+        self.statuses = []
+        # Number of first responses that are cut in the middle
+        self.truncated_responses = 0
+
+    def handle(self, handler):
+        self.requests.append(dict(handler.headers))
+        if handler.headers.get('If-None-Match') == self.etag:
+            self.statuses.append(304)
+            handler.send_response(304)
+            handler.end_headers()
+            return
+        start = 0
+        if handler.headers.get('Range') and handler.headers.get('If-Range') == self.etag:
+            start = int(handler.headers['Range'].split('=')[1].rstrip('-'))
+            self.statuses.append(206)
+            handler.send_response(206)
+            handler.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(self.content) - 1,
+                                                                         len(self.content)))
+        else:
+            self.statuses.append(200)
+            handler.send_response(200)
+        handler.send_header('Content-Length', str(len(self.content) - start))
+        handler.send_header('ETag', self.etag)
+        handler.send_header('Last-Modified', self.last_modified)
+        handler.end_headers()
+        if self.truncated_responses:
+            self.truncated_responses -= 1
+            handler.wfile.write(self.content[start:start + (len(self.content) - start) // 2])
+            handler.close_connection = True
+            return
+        handler.wfile.write(self.content[start:])
+
+
+@pytest.fixture
+def archive_server():
+    server_state = ArchiveServer(make_recipe_zip("pkg", 300000))
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server_state.handle(self)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server_state.url = "http://127.0.0.1:{}/pkg.zip".format(server.server_address[1])
+    yield server_state
+    server.shutdown()
+    server.server_close()
+
+
+class FakeBuilds:
+    """ Records order of builds of install_external_packages, packages listed in fail are failed """
+
+    def __init__(self, fail=()):
+        self.lock = threading.Lock()
+        self.fail = set(fail)
+        self.events = []
+
+    def prefetch(self, package, conanfile_path, bundle=None, offline=False):
+        return False, package.url
+
+    def build(self, args, package, source_dir):
+        with self.lock:
+            self.events.append(('start', package.name))
+        time.sleep(0.05)
+        with self.lock:
+            self.events.append(('end', package.name))
+        if package.name in self.fail:
+            raise Exception("{} has failed".format(package.name))
+
+    def started(self):
+        return [name for event, name in self.events if event == 'start']
+
+    def finished_before_start(self, dependency, dependent):
+        return self.events.index(('end', dependency)) < self.events.index(('start', dependent))
+
+
+@pytest.fixture
+def fake_builds(conanex_home, monkeypatch):
+    builds = FakeBuilds()
+    monkeypatch.setattr(main, 'run_history', RunHistory(str(conanex_home / "history.db")))
+    monkeypatch.setattr(main, 'prefetch_external_package', builds.prefetch)
+    monkeypatch.setattr(main, 'build_external_package', builds.build)
+    return builds
@@ -0,0 +1,23 @@
+import os
+
+from conanex import main
+from conanex.api import InstallOptions, install
+
+
+def test_install_output_goes_to_callable_and_generated_files_are_kept(tmp_path, conanex_home, monkeypatch, capfd):
+    monkeypatch.setitem(main.nenv, 'CONAN_HOME', str(tmp_path / "conan_home"))
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "conanfile.txt").write_text("[requires]\n\n[generators]\nCMakeToolchain\n")
+    profile = tmp_path / "profile"
+    profile.write_text("[settings]\nos=Linux\narch=x86_64\nbuild_type=Release\n")
+    messages = []
+
+    result = install(str(project), InstallOptions(profile=str(profile), profile_build=str(profile)),
+                     output=messages.append)
+
+    assert result.output_folders == [str(project)]
+    assert os.path.isfile(project / "conan_toolchain.cmake")
+    assert any("conans.conan install" in message for message in messages)
+    captured = capfd.readouterr()
+    assert captured.out == '' and captured.err == ''
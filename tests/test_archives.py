@@ -0,0 +1,67 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+from conanex.main import detect_archive_format, extract_archive
+
+
+def make_tar(path, mode):
+    content = b"from conan import ConanFile\n"
+    with tarfile.open(path, mode) as tar:
+        info = tarfile.TarInfo("pkg/conanfile.py")
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+def compress_zstd(data):
+    try:
+        from compression import zstd
+        return zstd.compress(data)
+    except ImportError:
+        pass
+    zstandard = pytest.importorskip("zstandard")
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def test_tar_xz_is_detected_by_content_not_by_suffix(tmp_path):
+    archive_path = make_tar(str(tmp_path / "v1.0.zip"), "w:xz")
+    extract_dir = tmp_path / "extracted"
+
+    assert detect_archive_format(archive_path) == 'xz'
+    extract_archive(str(extract_dir), archive_path, "https://example.com/v1.0.zip")
+
+    assert os.path.isfile(extract_dir / "pkg" / "conanfile.py")
+
+
+def test_plain_tar_is_extracted(tmp_path):
+    archive_path = make_tar(str(tmp_path / "download"), "w")
+    extract_dir = tmp_path / "extracted"
+
+    assert detect_archive_format(archive_path) == 'tar'
+    extract_archive(str(extract_dir), archive_path, "https://example.com/download")
+
+    assert os.path.isfile(extract_dir / "pkg" / "conanfile.py")
+
+
+def test_tar_zst_is_extracted(tmp_path):
+    tar_path = make_tar(str(tmp_path / "pkg.tar"), "w")
+    archive_path = tmp_path / "pkg.tar.gz"
+    with open(tar_path, "rb") as f:
+        archive_path.write_bytes(compress_zstd(f.read()))
+    extract_dir = tmp_path / "extracted"
+
+    assert detect_archive_format(str(archive_path)) == 'zst'
+    extract_archive(str(extract_dir), str(archive_path), "https://example.com/pkg.tar.gz")
+
+    assert os.path.isfile(extract_dir / "pkg" / "conanfile.py")
+
+
+def test_unknown_format_is_reported(tmp_path):
+    archive_path = tmp_path / "pkg.tar.gz"
+    archive_path.write_bytes(b"<html>Not found</html>")
+
+    with pytest.raises(Exception, match="Unsupported archive format of https://example.com/pkg.tar.gz"):
+        extract_archive(str(tmp_path / "extracted"), str(archive_path), "https://example.com/pkg.tar.gz")
@@ -0,0 +1,86 @@
+import argparse
+import threading
+import time
+
+from conanex import main
+from conanex.main import ConanArgs, ExternalPackage, build_create_args, build_install_args, build_matrix_args, \
+    install_package_from_remote, run_conan_install_commands, with_build_jobs
+
+
+def make_args(**kwargs):
+    return ConanArgs(argparse.Namespace(**kwargs))
+
+
+def test_matrix_entry_keeps_profile_through_build_jobs():
+    args = make_args(matrix_profile=['default', 'dbg'], settings=[['os=Linux']])
+    package = ExternalPackage('fa', '1.0', None, None, 'path', '../fa')
+    matrix = build_matrix_args(args)
+
+    create_args = [build_create_args(with_build_jobs(entry_args, 2), "/tmp/fa", package) for entry_args in matrix]
+
+    assert create_args[0][create_args[0].index('-pr:h') + 1] == 'default'
+    assert create_args[1][create_args[1].index('-pr:h') + 1] == 'dbg'
+    for entry_create_args in create_args:
+        assert 'os=Linux' in entry_create_args
+        assert 'tools.build:jobs=2' in entry_create_args
+
+
+def test_matrix_settings_are_kept_through_build_jobs():
+    args = make_args(matrix_settings=['build_type=Release', 'build_type=Debug'])
+    package = ExternalPackage('fa', '1.0', None, None, 'path', '../fa')
+
+    create_args = [build_create_args(with_build_jobs(entry_args, 1), "/tmp/fa", package)
+                   for entry_args in build_matrix_args(args)]
+
+    assert 'build_type=Release' in create_args[0] and 'build_type=Debug' not in create_args[0]
+    assert 'build_type=Debug' in create_args[1] and 'build_type=Release' not in create_args[1]
+
+
+def test_remote_package_of_matrix_entry_is_installed_with_its_profile(monkeypatch):
+    installs = []
+    monkeypatch.setattr(main, 'run_conan_install_command',
+                        lambda args, package: installs.append(build_install_args(args, package)))
+    args = make_args(matrix_profile=['default', 'dbg'])
+    package = ExternalPackage('fa', '1.0', None, None, 'remote', 'myremote')
+
+    for entry_args in build_matrix_args(args):
+        install_package_from_remote(entry_args, package)
+
+    assert [install_args[install_args.index('-pr:h') + 1] for install_args in installs] == ['default', 'dbg']
+    assert all(install_args[install_args.index('-r') + 1] == 'myremote' for install_args in installs)
+
+
+def test_installs_into_shared_output_folder_do_not_overlap(monkeypatch):
+    lock = threading.Lock()
+    active = {}
+    overlaps = []
+
+    def run_install(args, conanfile_path):
+        with lock:
+            active[args.output_folder] = active.get(args.output_folder, 0) + 1
+            overlaps.append(active[args.output_folder] > 1)
+        time.sleep(0.05)
+        with lock:
+            active[args.output_folder] -= 1
+
+    monkeypatch.setattr(main, 'run_conan_install_command', run_install)
+    args = make_args(matrix_settings=['build_type=Release', 'build_type=Debug'], output_folder='build/conan')
+
+    run_conan_install_commands([(entry_args, "conanfile.txt") for entry_args in build_matrix_args(args)])
+
+    assert overlaps == [False, False]
+
+
+def test_offline_install_does_not_reach_remotes():
+    args = make_args(offline=True, remote='conancenter')
+    package = ExternalPackage('fa', '1.0', None, None, 'zip', '/tmp/fa.zip')
+
+    for conan_args in [build_create_args(args, "/tmp/fa", package), build_install_args(args, "conanfile.txt")]:
+        assert '--no-remote' in conan_args
+        assert '-r' not in conan_args
+
+
+def test_install_from_bundle_does_not_reach_remotes():
+    args = make_args(from_bundle='deps.zip')
+
+    assert '--no-remote' in build_install_args(args, "conanfile.txt")
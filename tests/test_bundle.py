@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import sys
+import zipfile
+
+import pytest
+
+from conanex import main
+from conanex.bundle import Bundle, BUNDLE_INDEX, tree_digest
+from conanex.cache import SourceCache
+from conanex.main import ConanArgs, parse_external_package
+from conanex.schedule import NetworkLimits
+
+
+def package_definition(url):
+    return "pkg/1.0 {{ zip = {} }}".format(url)
+
+
+def write_conanfile(tmp_path, url):
+    conanfile_path = tmp_path / "conanfile.txt"
+    conanfile_path.write_text("[requires]\n{}\n".format(package_definition(url)))
+    return conanfile_path
+
+
+def test_bundle_create_command_takes_fetch_limits(tmp_path, conanex_home, archive_server, monkeypatch):
+    conanfile_path = write_conanfile(tmp_path, archive_server.url)
+    bundle_path = tmp_path / "deps.zip"
+    monkeypatch.setattr(main, 'network_limits', NetworkLimits(8, 4))
+    monkeypatch.setattr(sys, 'argv', ['conanex', 'bundle', 'create', str(conanfile_path), '-o', str(bundle_path),
+                                      '--fetch-jobs', '2', '--fetch-jobs-per-host', '1'])
+
+    main.run()
+
+    assert main.network_limits.limits == (2, 1)
+    with zipfile.ZipFile(bundle_path) as bundle:
+        assert any(name.endswith("/conanfile.py") for name in bundle.namelist())
+
+
+def create_bundle(tmp_path, url):
+    bundle_path = tmp_path / "deps.zip"
+    main.create_bundle(ConanArgs(argparse.Namespace(path_or_reference=str(write_conanfile(tmp_path, url)),
+                                                    output=str(bundle_path))))
+    return bundle_path
+
+
+def corrupt_digest(bundle_path):
+    with zipfile.ZipFile(bundle_path) as bundle:
+        entries = [(info, bundle.read(info)) for info in bundle.infolist()]
+    with zipfile.ZipFile(bundle_path, 'w') as bundle:
+        for info, data in entries:
+            if info.filename == BUNDLE_INDEX:
+                index = json.loads(data)
+                for sources in index['sources'].values():
+                    sources['digest'] = '0' * 64
+                data = json.dumps(index)
+            bundle.writestr(info, data)
+
+
+def test_bundle_sources_are_restored_into_source_cache(tmp_path, conanex_home, archive_server):
+    bundle_path = create_bundle(tmp_path, archive_server.url)
+    package = parse_external_package(package_definition(archive_server.url))
+    build_node_cache = SourceCache(str(tmp_path / "build_node" / "sources"))
+
+    bundle = Bundle(str(bundle_path))
+    try:
+        source_dir = bundle.fetch(package, build_node_cache)
+    finally:
+        bundle.close()
+
+    kind, key = build_node_cache.entry_of(source_dir)
+    assert source_dir == build_node_cache.entry_path(kind, key)
+    assert tree_digest(source_dir) == tree_digest(main.source_cache.entry_path(kind, key))
+    assert os.path.isfile(os.path.join(source_dir, "pkg", "conanfile.py"))
+
+
+def test_bundle_sources_with_wrong_digest_are_rejected(tmp_path, conanex_home, archive_server):
+    bundle_path = create_bundle(tmp_path, archive_server.url)
+    corrupt_digest(bundle_path)
+    package = parse_external_package(package_definition(archive_server.url))
+    build_node_cache = SourceCache(str(tmp_path / "build_node" / "sources"))
+
+    bundle = Bundle(str(bundle_path))
+    try:
+        with pytest.raises(Exception, match="Calculated digest"):
+            bundle.fetch(package, build_node_cache)
+        sources = list(bundle.index['sources'].values())[0]
+    finally:
+        bundle.close()
+
+    assert build_node_cache.lookup(sources['kind'], sources['key']) is None
@@ -0,0 +1,56 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import TimeoutExpired
+
+from conanex import main
+from conanex.main import ExternalPackage, is_package_in_cache
+
+
+class FakeConanList:
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+    timeout = False
+
+    def __init__(self, command, **kwargs):
+        self.killed = False
+
+    def __enter__(self):
+        with FakeConanList.lock:
+            FakeConanList.running += 1
+            FakeConanList.max_running = max(FakeConanList.max_running, FakeConanList.running)
+        return self
+
+    def __exit__(self, *args):
+        with FakeConanList.lock:
+            FakeConanList.running -= 1
+
+    def communicate(self, timeout=None):
+        if FakeConanList.timeout and not self.killed:
+            raise TimeoutExpired("conan", timeout)
+        time.sleep(0.02)
+        return b'{"Local Cache": {"fa/1.0": {}}}', None
+
+    def kill(self):
+        self.killed = True
+
+
+def test_timed_out_cache_check_is_cache_miss(monkeypatch):
+    monkeypatch.setattr(main, 'Popen', FakeConanList)
+    monkeypatch.setattr(FakeConanList, 'timeout', True)
+
+    assert not is_package_in_cache(ExternalPackage('fa', '1.0', None, None, 'zip', '/tmp/fa.zip'))
+
+
+def test_cache_checks_are_limited_by_cpu_slots(monkeypatch):
+    monkeypatch.setattr(main, 'Popen', FakeConanList)
+    monkeypatch.setattr(main, 'cpu_slots', threading.BoundedSemaphore(2))
+    package = ExternalPackage('fa', '1.0', None, None, 'zip', '/tmp/fa.zip')
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda _: is_package_in_cache(package), range(16)))
+
+    assert all(results)
+    assert FakeConanList.max_running <= 2
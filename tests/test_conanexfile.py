@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from conanex import ConanExFile
+from conanex.main import ExternalPackage, install_external_packages
+
+
+class Recipe(ConanExFile):
+    settings = "os", "arch"
+
+
+def make_recipe(recipe_folder):
+    recipe = Recipe()
+    recipe.recipe_folder = str(recipe_folder)
+    recipe.settings = {'os': 'Linux', 'arch': 'x86_64'}
+    return recipe
+
+
+def test_install_journal_of_recipe_is_kept_outside_of_recipe_folder(tmp_path, conanex_home, fake_builds):
+    recipe_folder = tmp_path / "export"
+    recipe_folder.mkdir()
+    package = ExternalPackage('zlib', '1.3', None, None, 'zip', 'zlib.zip')
+    fake_builds.fail.add('zlib')
+
+    with pytest.raises(Exception, match="zlib has failed"):
+        install_external_packages(make_recipe(recipe_folder).get_args(), [package])
+
+    assert os.listdir(recipe_folder) == []
+    journals = os.listdir(conanex_home / "journals")
+    assert len(journals) == 1
+    assert os.listdir(conanex_home / "journals" / journals[0]) == [".conanex-journal.json"]
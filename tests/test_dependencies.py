@@ -0,0 +1,108 @@
+import argparse
+
+import pytest
+
+from conanex.main import ConanArgs, ExternalPackage, get_external_dependencies, install_external_packages
+
+
+def make_path_package(tmp_path, name, recipe, conandata=None):
+    recipe_dir = tmp_path / name
+    recipe_dir.mkdir()
+    (recipe_dir / "conanfile.py").write_text(recipe)
+    if conandata is not None:
+        (recipe_dir / "conandata.yml").write_text(conandata)
+    return ExternalPackage(name, '1.0', None, None, 'path', str(recipe_dir)), str(recipe_dir)
+
+
+ZLIB = ExternalPackage('zlib', '1.3', None, None, 'zip', 'zlib.zip')
+FMT = ExternalPackage('fmt', '10.0', None, None, 'zip', 'fmt.zip')
+
+
+def test_exact_versions_and_ranges_are_detected(tmp_path):
+    package, source_dir = make_path_package(tmp_path, "app", '''
+class App(ConanFile):
+    requires = "zlib/[>=1.2 <2]"
+
+    def requirements(self):
+        self.requires("fmt/10.0")
+''')
+
+    assert get_external_dependencies(package, source_dir, [ZLIB, FMT]) == [ZLIB, FMT]
+
+
+def test_multiline_literal_requirement_is_detected(tmp_path):
+    package, source_dir = make_path_package(tmp_path, "app", '''
+class App(ConanFile):
+    def requirements(self):
+        self.requires(
+            "zlib/1.3")
+''')
+
+    assert get_external_dependencies(package, source_dir, [ZLIB, FMT]) == [ZLIB]
+
+
+def test_computed_requirements_are_not_detected(tmp_path):
+    package, source_dir = make_path_package(tmp_path, "app", '''
+class App(ConanFile):
+    def requirements(self):
+        self.requires(f"zlib/{self.zlib_version}")
+''')
+
+    assert get_external_dependencies(package, source_dir, [ZLIB, FMT]) is None
+
+
+def test_requirements_from_conandata_are_not_detected(tmp_path):
+    package, source_dir = make_path_package(tmp_path, "app", '''
+class App(ConanFile):
+    def requirements(self):
+        for requirement in self.conan_data["requires"]:
+            self.requires(requirement)
+''', conandata="requires:\n  - zlib/1.3\n")
+
+    assert get_external_dependencies(package, source_dir, [ZLIB, FMT]) is None
+
+
+def make_install_args(tmp_path, **kwargs):
+    conanfile_path = tmp_path / "conanfile.txt"
+    conanfile_path.write_text("[requires]\n")
+    return ConanArgs(argparse.Namespace(path_or_reference=str(conanfile_path), **kwargs))
+
+
+def test_package_with_computed_requirements_waits_for_packages_before_it(tmp_path, fake_builds):
+    zlib, zlib_dir = make_path_package(tmp_path, "zlib", "class Zlib(ConanFile):\n    pass\n")
+    app, app_dir = make_path_package(tmp_path, "app", '''
+class App(ConanFile):
+    def requirements(self):
+        self.requires(f"zlib/{self.zlib_version}")
+''')
+
+    install_external_packages(make_install_args(tmp_path), [zlib, app], jobs=2)
+
+    assert fake_builds.finished_before_start('zlib', 'app')
+
+
+def test_keep_going_with_one_job_builds_independent_packages_in_requires_order(tmp_path, fake_builds):
+    zlib, _ = make_path_package(tmp_path, "zlib", "class Zlib(ConanFile):\n    pass\n")
+    fmt, _ = make_path_package(tmp_path, "fmt", "class Fmt(ConanFile):\n    pass\n")
+    spdlog, _ = make_path_package(tmp_path, "spdlog", "class Spdlog(ConanFile):\n    requires = \"fmt/1.0\"\n")
+    app, _ = make_path_package(tmp_path, "app", "class App(ConanFile):\n    requires = \"zlib/1.0\"\n")
+    fake_builds.fail.add('fmt')
+
+    with pytest.raises(Exception, match="1 of 4 external package builds failed"):
+        install_external_packages(make_install_args(tmp_path, keep_going=True), [zlib, fmt, spdlog, app])
+
+    # spdlog depends on failed fmt, app does not
+    assert fake_builds.started() == ['zlib', 'fmt', 'app']
+    assert all(fake_builds.finished_before_start(dependency, dependent)
+               for dependency, dependent in [('zlib', 'fmt'), ('fmt', 'app')])
+
+
+def test_remote_package_waits_for_packages_before_it(tmp_path, fake_builds):
+    zlib, _ = make_path_package(tmp_path, "zlib", "class Zlib(ConanFile):\n    pass\n")
+    app = ExternalPackage('app', '1.0', None, None, 'remote', 'https://remote.example.com')
+
+    assert get_external_dependencies(app, None, [zlib]) is None
+
+    install_external_packages(make_install_args(tmp_path), [zlib, app], jobs=2)
+
+    assert fake_builds.finished_before_start('zlib', 'app')
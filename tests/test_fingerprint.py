@@ -0,0 +1,45 @@
+from conanex.fingerprint import FingerprintIndex
+
+
+def make_tree(tmp_path):
+    tree = tmp_path / "pkg"
+    (tree / "src").mkdir(parents=True)
+    (tree / "conanfile.py").write_text("from conan import ConanFile\n")
+    (tree / "src" / "lib.cpp").write_text("int f() { return 1; }\n")
+    return tree
+
+
+def test_local_build_output_does_not_change_digest(tmp_path):
+    index = FingerprintIndex(str(tmp_path / "fingerprints"))
+    tree = make_tree(tmp_path)
+    digest = index.scan(str(tree))
+
+    for build_dir in ["build/Release", "build-debug", "test_package/build", "test_package/build-release"]:
+        (tree / build_dir).mkdir(parents=True)
+        (tree / build_dir / "CMakeCache.txt").write_text("CMAKE_BUILD_TYPE=Release\n")
+    (tree / "CMakeUserPresets.json").write_text("{}\n")
+    (tree / "test_package" / "CMakeUserPresets.json").write_text("{}\n")
+
+    assert index.scan(str(tree)) == digest
+
+
+def test_sources_in_nested_build_folders_change_digest(tmp_path):
+    index = FingerprintIndex(str(tmp_path / "fingerprints"))
+    tree = make_tree(tmp_path)
+    (tree / "cmake" / "build").mkdir(parents=True)
+    (tree / "cmake" / "build" / "flags.cmake").write_text("set(FLAGS -O2)\n")
+    digest = index.scan(str(tree))
+
+    (tree / "cmake" / "build" / "flags.cmake").write_text("set(FLAGS -O3)\n")
+
+    assert index.scan(str(tree)) != digest
+
+
+def test_changed_source_changes_digest(tmp_path):
+    index = FingerprintIndex(str(tmp_path / "fingerprints"))
+    tree = make_tree(tmp_path)
+    digest = index.scan(str(tree))
+
+    (tree / "src" / "lib.cpp").write_text("int f() { return 2; }\n")
+
+    assert index.scan(str(tree)) != digest
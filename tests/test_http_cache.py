@@ -0,0 +1,18 @@
+from conanex.main import ExternalPackage, fetch_package_from_zip
+
+
+def test_unchanged_archive_is_revalidated_and_taken_from_source_cache(conanex_home, archive_server):
+    package = ExternalPackage('pkg', '1.0', None, None, 'zip', archive_server.url)
+    source_dir = fetch_package_from_zip(package)
+
+    assert archive_server.statuses == [200]
+    assert 'If-None-Match' not in archive_server.requests[0]
+
+    package = ExternalPackage('pkg', '1.0', None, None, 'zip', archive_server.url)
+    assert fetch_package_from_zip(package) == source_dir
+
+    assert archive_server.statuses == [200, 304]
+    assert archive_server.requests[1]['If-None-Match'] == archive_server.etag
+    assert archive_server.requests[1]['If-Modified-Since'] == archive_server.last_modified
+    assert package.stats['source_cache_hit']
+    assert not package.stats.get('bytes_downloaded')
@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from conanex import main
+from conanex.main import ExternalPackage, fetch_package_from_zip
+
+
+def test_interrupted_download_is_resumed_with_range_request(conanex_home, archive_server):
+    archive_server.truncated_responses = 1
+    package = ExternalPackage('pkg', '1.0', None, None, 'zip', archive_server.url)
+
+    with pytest.raises(Exception, match="interrupted"):
+        fetch_package_from_zip(package)
+    partial_path = main.partial_downloads.partial_path(archive_server.url)
+    assert os.path.getsize(partial_path) > 0
+
+    package = ExternalPackage('pkg', '1.0', None, None, 'zip', archive_server.url)
+    source_dir = fetch_package_from_zip(package)
+
+    assert archive_server.requests[-1]['Range'] == 'bytes={}-'.format(len(archive_server.content) // 2)
+    assert package.stats['bytes_downloaded'] == len(archive_server.content) - len(archive_server.content) // 2
+    assert os.path.isfile(os.path.join(source_dir, "conanfile.py"))
+    # Staging files are not left in downloads folder
+    assert os.listdir(main.partial_downloads.root) == []
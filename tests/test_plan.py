@@ -0,0 +1,20 @@
+import argparse
+import hashlib
+
+from conanex import main
+from conanex.main import ConanArgs, ExternalPackage, plan_package_sources, describe_plan_sources
+
+
+def test_local_archive_is_planned_as_local_or_cached(tmp_path, conanex_home):
+    archive_path = tmp_path / "pkg.zip"
+    archive_path.write_bytes(b"archive")
+    package = ExternalPackage('pkg', '1.0', None, None, 'zip', str(archive_path))
+    args = ConanArgs(argparse.Namespace())
+
+    sources = plan_package_sources(args, package, str(tmp_path))
+    assert sources == {'action': 'local'}
+    assert describe_plan_sources(sources) == "local"
+
+    main.source_cache.store('zip', hashlib.sha256(b"archive").hexdigest(), lambda dirname: None)
+
+    assert plan_package_sources(args, package, str(tmp_path)) == {'action': 'cached'}
@@ -0,0 +1,32 @@
+import os
+
+from conanex.cache import SourceCache, materialize_tree
+
+
+def populate(dirname):
+    with open(os.path.join(dirname, "CMakeLists.txt"), "w") as f:
+        f.write("project(pkg)\n")
+
+
+def test_working_copy_is_made_on_cache_filesystem(tmp_path):
+    cache = SourceCache(str(tmp_path / "sources"))
+    source_dir = cache.store('zip', 'abc', populate)
+
+    with cache.open_work_dir() as work_dir:
+        materialize_tree(source_dir, work_dir)
+        assert os.stat(work_dir).st_dev == os.stat(source_dir).st_dev
+        assert os.path.commonpath([work_dir, cache.root]) == cache.root
+    assert not os.path.exists(work_dir)
+
+
+def test_write_to_working_copy_does_not_change_cached_sources(tmp_path):
+    cache = SourceCache(str(tmp_path / "sources"))
+    source_dir = cache.store('zip', 'abc', populate)
+
+    with cache.open_work_dir() as work_dir:
+        materialize_tree(source_dir, work_dir)
+        with open(os.path.join(work_dir, "CMakeLists.txt"), "a") as f:
+            f.write("add_library(pkg pkg.cpp)\n")
+
+    with open(os.path.join(source_dir, "CMakeLists.txt")) as f:
+        assert f.read() == "project(pkg)\n"
@@ -0,0 +1,17 @@
+import argparse
+import os
+
+from conanex.main import ConanArgs, build_component_args, build_install_args, build_matrix_args
+
+
+def test_component_install_keeps_profile_of_matrix_entry():
+    args = ConanArgs(argparse.Namespace(matrix_profile=['p1', 'p2'], output_folder='out/{matrix}'))
+    workspace_root = os.path.abspath('ws')
+    conanfile_path = os.path.join(workspace_root, 'a', 'conanfile.txt')
+
+    installs = [build_install_args(build_component_args(entry_args, workspace_root, conanfile_path), conanfile_path)
+                for entry_args in build_matrix_args(args)]
+
+    for install_args, profile in zip(installs, ['p1', 'p2']):
+        assert install_args[install_args.index('-pr:h') + 1] == profile
+        assert install_args[install_args.index('-of') + 1] == os.path.join('out', profile, 'a')